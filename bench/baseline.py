@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Callable
+
+
+def add_baseline_arguments(parser: argparse.ArgumentParser, default: Path) -> None:
+    parser.add_argument("--save-baseline", action="store_true", help=f"Сохранить отчет как базовый ({default})")
+    parser.add_argument("--baseline", type=Path, default=default)
+    parser.add_argument("--threshold", type=float, default=0.25, help="Допустимый рост относительно базового, доля")
+
+
+def check_baseline(
+        report: dict,
+        args: argparse.Namespace,
+        compare: Callable[[dict, dict, float], list[str]],
+) -> None:
+    """Сохраняет отчет как базовый или сравнивает с сохраненным; при регрессиях завершает процесс с кодом 1."""
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Базовые замеры сохранены в {args.baseline}")
+    elif args.baseline.exists():
+        found = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+        for line in found:
+            print(f"Регрессия: {line}")
+        if found:
+            sys.exit(1)
+        print("Регрессий нет.")
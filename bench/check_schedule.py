@@ -0,0 +1,31 @@
+import sys
+from datetime import datetime
+
+# Неделя с 2025-09-01 (понедельник): момент -> ожидаемый ответ is_game_night.
+CASES = {
+    datetime(2025, 9, 1, 1, 0): False,  # ночь на понедельник - хвост воскресенья, игр нет
+    datetime(2025, 9, 1, 20, 0): False,  # понедельник вечером
+    datetime(2025, 9, 2, 12, 0): False,  # вторник днем
+    datetime(2025, 9, 2, 20, 0): True,  # вторник, IF
+    datetime(2025, 9, 3, 2, 0): True,  # ночь после вторника
+    datetime(2025, 9, 5, 21, 0): True,  # пятница, ТВТ2
+    datetime(2025, 9, 6, 17, 0): True,  # суббота, ТВТ1
+    datetime(2025, 9, 7, 2, 0): True,  # ночь на воскресенье - хвост субботы
+    datetime(2025, 9, 7, 5, 0): False,  # воскресенье утром
+    datetime(2025, 9, 7, 20, 0): False,  # воскресенье вечером
+}
+
+
+if __name__ == "__main__":
+    from logic.scheduler import is_game_night
+
+    found = [
+        f"{moment:%a %Y-%m-%d %H:%M}: ожидалось {expected}"
+        for moment, expected in CASES.items()
+        if is_game_night(moment) != expected
+    ]
+    for line in found:
+        print(f"Расхождение: {line}")
+    if found:
+        sys.exit(1)
+    print("Расписание игровых вечеров совпадает.")
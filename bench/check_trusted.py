@@ -0,0 +1,65 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.generate_ocap import write_ocap
+
+# Набор синтетических миссий: разные размеры и seed, в том числе без ТС и с одним игроком.
+CASES = [
+    {"players": 20, "vehicles": 8, "frames": 600, "kills": 40, "seed": 1},
+    {"players": 60, "vehicles": 20, "frames": 1200, "kills": 150, "seed": 2},
+    {"players": 1, "vehicles": 0, "frames": 50, "kills": 3, "seed": 3},
+    {"players": 40, "vehicles": 30, "frames": 900, "kills": 300, "seed": 4},
+]
+
+
+def compare_modes(path: Path) -> list[str]:
+    """Разбирает файл в строгом и доверенном режиме и возвращает найденные различия."""
+    from logic.mission_pars import build_mission_stats
+    from module.ocap_models import OCAP
+
+    started = time.perf_counter()
+    strict = OCAP.from_file(path)
+    strict_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    trusted = OCAP.from_file(path, trusted=True)
+    trusted_seconds = time.perf_counter() - started
+    print(f"{path.name}: строгий {strict_seconds:.3f} с, доверенный {trusted_seconds:.3f} с")
+
+    diffs = []
+    for field in ("players", "vehicles", "events"):
+        if getattr(strict, field) != getattr(trusted, field):
+            diffs.append(f"{path.name}: OCAP.{field} различается")
+    for field in ("game_type", "max_frame", "mission_name", "world_name", "win_side"):
+        if getattr(strict, field) != getattr(trusted, field):
+            diffs.append(f"{path.name}: OCAP.{field} {getattr(strict, field)!r} != {getattr(trusted, field)!r}")
+
+    strict_doc = build_mission_stats(path, use_cache=False, trusted=False)
+    trusted_doc = build_mission_stats(path, use_cache=False, trusted=True)
+    if json.dumps(strict_doc, sort_keys=True, default=str) != json.dumps(trusted_doc, sort_keys=True, default=str):
+        diffs.append(f"{path.name}: документы статистики различаются")
+    return diffs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка, что доверенный режим разбора дает ту же статистику")
+    parser.add_argument("paths", nargs="*", type=Path, help="Реальные файлы OCAP в дополнение к синтетическим")
+    args = parser.parse_args()
+
+    found = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = [
+            write_ocap(Path(tmp_dir) / f"2025_08_29__21_10_trusted_{n}.json", **case)
+            for n, case in enumerate(CASES)
+        ]
+        for ocap_file in files + args.paths:
+            found.extend(compare_modes(ocap_file))
+
+    for line in found:
+        print(f"Различие: {line}")
+    if found:
+        sys.exit(1)
+    print("Режимы дают одинаковый результат.")
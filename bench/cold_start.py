@@ -0,0 +1,85 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from bench.baseline import add_baseline_arguments, check_baseline
+from main import COMMANDS
+
+# Время от запуска интерпретатора до начала работы команды: --help разбирается уже модулем команды,
+# то есть все его импорты выполнены. Запуск без команды и импорт config - нижняя граница.
+CASES = {
+    "config": ["-c", "import config"],
+    "main": ["main.py", "--help"],
+    **{command: ["main.py", command, "--help"] for command in COMMANDS},
+}
+
+# Тяжелые зависимости, которые команда не должна грузить без нужды.
+HEAVY = ("pymongo", "pydantic", "numpy", "httpx", "requests")
+
+DEFAULT_BASELINE = Path("bench/cold_start_baseline.json")
+
+
+def run_case(args: list[str]) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - started
+
+
+def heavy_imports(args: list[str]) -> list[str]:
+    """Какие из HEAVY импортирует команда, по выводу -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True, check=True,
+    )
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            loaded.add(line.rsplit("|", 1)[1].strip())
+    return [name for name in HEAVY if name in loaded]
+
+
+def run(repeat: int) -> dict:
+    report = {"python": sys.version.split()[0], "cases": {}}
+    for case, args in CASES.items():
+        run_case(args)  # прогрев кэша байткода и файловой системы
+        times = [run_case(args) for _ in range(repeat)]
+        report["cases"][case] = {
+            "wall_min_s": round(min(times), 4),
+            "wall_median_s": round(statistics.median(times), 4),
+            "heavy": heavy_imports(args),
+        }
+        result = report["cases"][case]
+        print(f"{case:<10} {result['wall_median_s']:>7.3f} с  {', '.join(result['heavy']) or '-'}")
+    return report
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Команды, у которых лучшее время выросло больше чем на threshold или добавились тяжелые импорты."""
+    regressions = []
+    for case, result in report["cases"].items():
+        base = baseline.get("cases", {}).get(case)
+        if not base:
+            continue
+        # Небольшой абсолютный допуск на шум запуска процесса.
+        if result["wall_min_s"] > base["wall_min_s"] * (1 + threshold) + 0.02:
+            regressions.append(f"{case}: wall_min_s {base['wall_min_s']} -> {result['wall_min_s']}")
+        added = set(result["heavy"]) - set(base["heavy"])
+        if added:
+            regressions.append(f"{case}: новые тяжелые импорты {', '.join(sorted(added))}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Время холодного старта команд main.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    add_baseline_arguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    check_baseline(run(args.repeat), args, compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import random
+from pathlib import Path
+
+SIDES = ("WEST", "EAST", "GUER")
+SQUAD_TAGS = ("LG", "TF", "RMC", "7th", "SYND", "DG", "NOPE")
+VEHICLE_CLASSES = ("car", "truck", "apc", "tank", "heli", "static-weapon")
+WEAPONS = (
+    "AK-74М",
+    "M4A1 Block II (AFG/SOPMOD Stock)",
+    "РПГ-26 (отстрелянный)",
+    "M136 HEAT (used)",
+    "[CUP] Mk16 SCAR-L STD [Desert]",
+    "ПКМ",
+)
+
+
+def _nickname(rnd: random.Random, n: int) -> str:
+    tag = rnd.choice(SQUAD_TAGS)
+    return rnd.choice((
+        f"[{tag}] Nick{n}",
+        f"{tag}.Nick{n}",
+        f"{tag} Nick{n}",
+        f"Nick{n}",
+    ))
+
+
+def generate_ocap(
+        players: int = 60,
+        vehicles: int = 20,
+        frames: int = 1200,
+        kills: int = 100,
+        seed: int = 0,
+) -> dict:
+    """
+    Синтетическая запись OCAP в формате сервера: юниты, ТС (с парашютом, который разбор отбрасывает),
+    экипажи, которые ездят вместе с техникой, события connected/killed/endMission.
+    Одинаковые параметры и seed дают одинаковый файл.
+    """
+    rnd = random.Random(seed)
+    entities = []
+    vehicle_tracks: dict[int, tuple[int, list]] = {}
+
+    for _ in range(vehicles):
+        entity_id = len(entities)
+        start = rnd.choice((0, 0, 0, rnd.randrange(frames // 4 or 1)))
+        x, y = rnd.uniform(1000, 20000), rnd.uniform(1000, 20000)
+        positions = []
+        for _ in range(frames - start):
+            x += rnd.uniform(-4, 4)
+            y += rnd.uniform(-4, 4)
+            positions.append([[round(x, 2), round(y, 2), 5.0], rnd.randrange(360), 1, []])
+        entities.append({
+            "positions": positions,
+            "framesFired": [],
+            "startFrameNum": start,
+            "type": "vehicle",
+            "id": entity_id,
+            "name": f"Vehicle {entity_id}",
+            "class": rnd.choice(VEHICLE_CLASSES),
+        })
+        vehicle_tracks[entity_id] = (start, positions)
+
+    entities.append({
+        "positions": [[[0.0, 0.0, 300.0], 0, 1, []]],
+        "framesFired": [],
+        "startFrameNum": 0,
+        "type": "vehicle",
+        "id": len(entities),
+        "name": "Steerable Parachute",
+        "class": "parachute",
+    })
+
+    player_ids = []
+    for n in range(players):
+        entity_id = len(entities)
+        name = _nickname(rnd, n)
+        is_player = rnd.random() > 0.05
+        start = rnd.choice((0, 0, 0, rnd.randrange(frames // 10 or 1)))
+        ride = rnd.choice(list(vehicle_tracks) + [None] * 3) if vehicle_tracks else None
+        x, y = rnd.uniform(1000, 20000), rnd.uniform(1000, 20000)
+        positions = []
+        for rel in range(frames - start):
+            if ride is not None and rel % 50 < 40:
+                # Экипаж: координаты совпадают с ТС или отстоят от нее на пару метров.
+                vehicle_start, track = vehicle_tracks[ride]
+                index = min(max(rel + start - vehicle_start, 0), len(track) - 1)
+                vx, vy = track[index][0][:2]
+                jitter = 0 if rel % 3 else rnd.uniform(-3, 3)
+                x, y = vx + jitter, vy + jitter
+            else:
+                x += rnd.uniform(-2, 2)
+                y += rnd.uniform(-2, 2)
+            frame_name = name if is_player or rel > 20 else ""
+            positions.append([[round(x, 2), round(y, 2)], rnd.randrange(360), 1, int(ride is not None), frame_name, 1])
+        entities.append({
+            "positions": positions,
+            "framesFired": [],
+            "startFrameNum": start,
+            "type": "unit",
+            "id": entity_id,
+            "name": name if is_player else "Rifleman",
+            "group": f"Alpha {n // 8 + 1}",
+            "side": rnd.choice(SIDES[:2]),
+            "isPlayer": int(is_player),
+            "role": "Rifleman",
+        })
+        player_ids.append(entity_id)
+
+    events = [[0, "connected", entities[pid]["name"]] for pid in player_ids[:10]]
+    victims = player_ids + list(vehicle_tracks)
+    for _ in range(kills if player_ids else 0):
+        frame = rnd.randrange(frames)
+        victim = rnd.choice(victims)
+        if rnd.random() < 0.05:
+            events.append([frame, "killed", victim, ["null"], -1])
+        else:
+            events.append([frame, "killed", victim, [rnd.choice(player_ids), rnd.choice(WEAPONS)], rnd.randrange(800)])
+    events.sort(key=lambda e: e[0])
+    events.append([frames - 1, "endMission", [rnd.choice(SIDES[:2]), "Mission complete"]])
+
+    return {
+        "Markers": [["Objective", 0, frames, [[0, [5000.0, 5000.0], 0, 1]], 0, "mil_objective", "ColorRed", 1, "ICON"]],
+        "captureDelay": 1,
+        "endFrame": frames,
+        "entities": entities,
+        "events": events,
+        "missionAuthor": "bench",
+        "missionName": f"Bench {players}x{frames}",
+        "times": [{"date": "2035-06-24T05:00:00", "frameNum": 0, "systemTimeUTC": "2025-08-29T18:10:00", "time": 0}],
+        "worldName": "altis",
+    }
+
+
+def write_ocap(path: Path, **params) -> Path:
+    with path.open("w", encoding="UTF-8") as fd:
+        json.dump(generate_ocap(**params), fd, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генератор синтетических OCAP")
+    parser.add_argument("path", type=Path, help="Имя файла вида 2025_08_29__21_10_name.json")
+    parser.add_argument("--players", type=int, default=60)
+    parser.add_argument("--vehicles", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=1200)
+    parser.add_argument("--kills", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_ocap(
+        args.path,
+        players=args.players,
+        vehicles=args.vehicles,
+        frames=args.frames,
+        kills=args.kills,
+        seed=args.seed,
+    )
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from pathlib import Path
+from queue import Empty, Queue
+
+from bench.generate_ocap import write_ocap
+
+# Большая синтетическая запись: на маленьких запуск пула дороже самого разбора.
+DEFAULT_CASE = {"players": 150, "vehicles": 60, "frames": 6000, "kills": 600, "seed": 22}
+
+
+def legacy_threaded_parse(path: Path):
+    """Разбор, как он был до потокового чтения: json.load целиком и три потока на игроков, ТС и убийства."""
+    from module.ocap_archive import open_ocap_text
+    from module.ocap_models import KillEvent, KillEventRaw, Player, Vehicle
+
+    with open_ocap_text(path) as fd:
+        data = json.load(fd)
+
+    queue = Queue()
+    threads = [
+        threading.Thread(target=Player.map_from_ocap_queued, args=(data, queue), daemon=True),
+        threading.Thread(target=Vehicle.map_from_ocap_queued, args=(data, queue), daemon=True),
+        threading.Thread(target=KillEventRaw.list_from_ocap_queued, args=(data, queue), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    parts = {}
+    for _ in threads:
+        with suppress(Empty):
+            parts |= queue.get_nowait()
+    players, vehicles = parts.get("players", {}), parts.get("vehicles", {})
+    return players, vehicles, KillEvent.map_from_ocap(players, vehicles, parts.get("events", []))
+
+
+def best_of(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def check_same(path: Path, workers: int) -> None:
+    from module.ocap_models import OCAP
+
+    serial = OCAP.from_file(path)
+    parallel = OCAP.from_file(path, parse_workers=workers)
+    if list(serial.players) != list(parallel.players) or list(serial.vehicles) != list(parallel.vehicles):
+        raise AssertionError(f"{path.name}: порядок сущностей различается")
+    for field in ("players", "vehicles", "events", "max_frame", "mission_name", "world_name", "win_side"):
+        if getattr(serial, field) != getattr(parallel, field):
+            raise AssertionError(f"{path.name}: OCAP.{field} различается")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Разбор сущностей в пуле процессов против прежнего разбора в потоках")
+    parser.add_argument("paths", nargs="*", type=Path, help="Файлы OCAP; без них - синтетическая большая запись")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from module.ocap_models import OCAP, shutdown_parse_executor
+
+    print(f"Python {sys.version.split()[0]}, ядер {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = args.paths or [write_ocap(Path(tmp_dir) / "2025_08_29__21_10_parallel.json", **DEFAULT_CASE)]
+        for path in paths:
+            print(f"{path.name}: {path.stat().st_size / 1024 ** 2:.1f} МБ")
+            legacy = best_of(lambda: legacy_threaded_parse(path), args.repeat)
+            serial = best_of(lambda: OCAP.from_file(path), args.repeat)
+            print(f"  потоки (прежний разбор)   {legacy:.3f} с")
+            print(f"  потоковый, 1 процесс      {serial:.3f} с  {legacy / serial:.2f}x")
+            for workers in args.workers:
+                check_same(path, workers)  # заодно прогревает пул
+                parallel = best_of(lambda: OCAP.from_file(path, parse_workers=workers), args.repeat)
+                print(
+                    f"  потоковый, {workers} процесса(ов)  {parallel:.3f} с  {legacy / parallel:.2f}x "
+                    f"от потоков, {serial / parallel:.2f}x от 1 процесса"
+                )
+    shutdown_parse_executor()
@@ -0,0 +1,74 @@
+import argparse
+import multiprocessing
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from pymongo import MongoClient
+
+from bench.generate_ocap import write_ocap
+
+DB_NAME = "stat_queue_bench"
+
+
+def _handle(directory: Path, filename: str) -> None:
+    from logic.mission_pars import build_mission_stats
+
+    # Только разбор и подсчет статистики: замеряется масштабирование очереди, а не запись миссий.
+    build_mission_stats(directory / filename, use_cache=False)
+
+
+def _worker(mongo_uri: str, directory: Path) -> None:
+    from logic.jobs import JobQueue, run_worker
+
+    queue = JobQueue(MongoClient(mongo_uri)[DB_NAME]["jobs"])
+    run_worker(queue, handler=partial(_handle, directory), poll_seconds=None)
+
+
+def run_round(mongo_uri: str, directory: Path, filenames: list[str], workers: int) -> float:
+    from logic.jobs import JobQueue
+
+    coll = MongoClient(mongo_uri)[DB_NAME]["jobs"]
+    coll.drop()
+    queue = JobQueue(coll)
+    queue.ensure_indexes()
+    queue.enqueue(filenames)
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker, args=(mongo_uri, directory)) for _ in range(workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    stats = queue.stats()
+    if stats["done"] != len(filenames):
+        raise RuntimeError(f"Обработаны не все задания: {stats}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность очереди logic.jobs от числа воркеров")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017", help="Локальный mongod; база " + DB_NAME)
+    parser.add_argument("--missions", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = Path(tmp_dir)
+        names = [
+            write_ocap(directory / f"2025_08_29__21_10_queue_{n}.json", players=60, frames=1200, seed=n).name
+            for n in range(args.missions)
+        ]
+        base = None
+        for worker_count in args.workers:
+            seconds = run_round(args.mongo_uri, directory, names, worker_count)
+            base = base or seconds * worker_count
+            print(
+                f"воркеров {worker_count}: {seconds:.2f} с, {len(names) / seconds:.1f} миссий/с, "
+                f"ускорение {base / seconds:.2f}x из {worker_count}"
+            )
+    MongoClient(args.mongo_uri).drop_database(DB_NAME)
@@ -0,0 +1,207 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable
+
+from bench.baseline import add_baseline_arguments, check_baseline
+from bench.generate_ocap import write_ocap
+from module.metrics import _rss_peak_bytes
+
+TIERS = {
+    "small": {"players": 20, "vehicles": 8, "frames": 600, "kills": 40},
+    "medium": {"players": 80, "vehicles": 25, "frames": 3000, "kills": 250},
+    "large": {"players": 150, "vehicles": 50, "frames": 7200, "kills": 600},
+}
+
+DEFAULT_BASELINE = Path("bench/baseline.json")
+
+
+class StubCollection:
+    """Заглушка коллекции Mongo: принимает записи и ничего не находит."""
+
+    def __init__(self):
+        self.written = 0
+
+    def with_options(self, **kwargs) -> "StubCollection":
+        return self
+
+    def find_one(self, *args, **kwargs) -> None:
+        return None
+
+    def find(self, *args, **kwargs) -> list:
+        return []
+
+    def distinct(self, *args, **kwargs) -> list:
+        return []
+
+    def bulk_write(self, requests: list, **kwargs) -> None:
+        self.written += len(requests)
+
+    def insert_many(self, docs: list, **kwargs) -> None:
+        self.written += len(docs)
+
+    def delete_many(self, *args, **kwargs) -> None:
+        return None
+
+    def update_one(self, *args, **kwargs) -> SimpleNamespace:
+        # Снятие отметки версии (logic.contribution) должно находить документ, иначе сводки не обновятся.
+        return SimpleNamespace(matched_count=1)
+
+    def update_many(self, *args, **kwargs) -> None:
+        return None
+
+
+def _measure(stage: Callable[[], Any], repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stage()
+        times.append(time.perf_counter() - started)
+
+    # Отдельный прогон под tracemalloc: он заметно замедляет код и не должен попадать во время.
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_min_s": round(min(times), 4),
+        "wall_median_s": round(statistics.median(times), 4),
+        "alloc_peak_mb": round(peak / 1024 ** 2, 2),
+        "rss_peak_mb": round(_rss_peak_bytes() / 1024 ** 2, 1),
+    }
+
+
+def run_tier(path: Path, repeat: int) -> dict:
+    """Все стадии для одного файла. Запускается в отдельном процессе, чтобы пик RSS был честным."""
+    from logic.mission_pars import build_mission_stats
+    from logic.name_logic import SquadResolver, extract_name_and_squad
+    from logic.storage import MissionWriter
+    from module.ocap_models import (
+        OCAP, KillEvent, KillEventRaw, EventType, parse_player_vehicle_id, resolve_killer_vehicles,
+        resolve_vehicle_crews,
+    )
+    from module.ocap_stream import OcapReader, EVENTS_KEY
+    from module.heatmap import mission_grids
+    from module.timeline import mission_timeline
+    from module.track_spill import MemoryGuard
+
+    ocap = OCAP.from_file(path)
+    raw_events = [
+        KillEventRaw.ocap_constructor(item) for key, item in OcapReader(path)
+        if key == EVENTS_KEY and item[1] == EventType.KILL
+    ]
+    names = [p.name for p in ocap.players.values()]
+    stub = StubCollection()
+    resolver = SquadResolver()
+
+    def process_ocap() -> None:
+        # Тот же путь, что process_ocap, но с заглушкой вместо Mongo и без кэша разбора.
+        if stub.find_one({"file": path.name}):
+            return
+        writer = MissionWriter(
+            coll=stub,
+            leaderboard_coll=stub,
+            heatmaps_coll=stub,
+            heatmap_missions_coll=stub,
+            timelines_coll=stub,
+            kills_coll=stub,
+            log_file=None,  # события mongo_write замеров не должны попадать в рабочий лог метрик
+        )
+        with writer:
+            writer.add(build_mission_stats(path, use_cache=False))
+
+    stages = {
+        "OCAP.from_file": lambda: OCAP.from_file(path),
+        "OCAP.from_file trusted": lambda: OCAP.from_file(path, trusted=True),
+        # Все колонки позиций сразу выгружаются на диск: цена режима с ограничением памяти.
+        "OCAP.from_file spilled": lambda: OCAP.from_file(
+            path, memory=MemoryGuard(1 << 62, Path(tempfile.gettempdir()), spill_at=0),
+        ),
+        "KillEvent.map_from_ocap": lambda: KillEvent.map_from_ocap(ocap.players, ocap.vehicles, raw_events),
+        "parse_player_vehicle_id": lambda: [
+            parse_player_vehicle_id(ocap, e.killer.id, e.frame) for e in ocap.events
+        ],
+        "resolve_killer_vehicles": lambda: resolve_killer_vehicles(ocap, ocap.events),
+        "resolve_vehicle_crews": lambda: resolve_vehicle_crews(ocap, ocap.events),
+        "mission_grids": lambda: mission_grids(ocap, 40960, 128, 10),
+        "mission_timeline": lambda: mission_timeline(ocap, 30),
+        "extract_name_and_squad": lambda: [extract_name_and_squad(name) for name in names],
+        "SquadResolver.resolve_many": lambda: resolver.resolve_many(names),
+        "process_ocap": process_ocap,
+    }
+    return {name: _measure(stage, repeat) for name, stage in stages.items()}
+
+
+def run(tiers: list[str], repeat: int) -> dict:
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "tiers": {},
+    }
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for tier in tiers:
+            path = write_ocap(Path(tmp_dir) / f"2025_08_29__21_10_bench_{tier}.json", **TIERS[tier])
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                stages = executor.submit(run_tier, path, repeat).result()
+            report["tiers"][tier] = {
+                "params": TIERS[tier],
+                "file_mb": round(path.stat().st_size / 1024 ** 2, 1),
+                "stages": stages,
+            }
+            path.unlink()
+            _print_tier(tier, stages)
+    return report
+
+
+def _print_tier(tier: str, stages: dict) -> None:
+    for stage, result in stages.items():
+        print(
+            f"{tier:>6} {stage:<28} {result['wall_median_s']:>9.4f} с  "
+            f"alloc {result['alloc_peak_mb']:>8.2f} МБ  rss {result['rss_peak_mb']:>8.1f} МБ"
+        )
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Стадии, у которых лучшее время или пик аллокаций выросли больше чем на threshold."""
+    regressions = []
+    for tier, tier_report in report["tiers"].items():
+        base_stages = baseline.get("tiers", {}).get(tier, {}).get("stages", {})
+        for stage, result in tier_report["stages"].items():
+            base = base_stages.get(stage)
+            if not base:
+                continue
+            # Сравнивается лучшее из повторов: оно меньше всего зависит от фоновой нагрузки.
+            for metric in ("wall_min_s", "alloc_peak_mb"):
+                # Небольшой абсолютный допуск, чтобы не ловить шум на микросекундных стадиях.
+                limit = base[metric] * (1 + threshold) + (0.005 if metric == "wall_min_s" else 0.5)
+                if result[metric] > limit:
+                    regressions.append(f"{tier}/{stage}: {metric} {base[metric]} -> {result[metric]}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Замеры производительности разбора OCAP")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["small", "medium"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="Куда сохранить отчет JSON")
+    add_baseline_arguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    bench_report = run(args.tiers, args.repeat)
+    if args.output:
+        args.output.write_text(json.dumps(bench_report, indent=2), encoding="utf-8")
+    check_baseline(bench_report, args, compare)
+
+
+if __name__ == "__main__":
+    main()
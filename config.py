@@ -1,5 +1,6 @@
 from pathlib import Path
-from pymongo import MongoClient
+
+from module.mongo import LazyDatabase
 
 OCAPS_URL = 'https://ocap.red-bear.ru/api/v1/operations?tag=&name=&newer=2025-01-01&older=2099-12-12'
 OCAP_URL = 'https://ocap.red-bear.ru/data/%s'
@@ -7,9 +8,117 @@ OCAP_URL = 'https://ocap.red-bear.ru/data/%s'
 OCAPS_PATH = Path("ocaps")
 TEMP_PATH = Path("temp")
 SQUAD_FILE = Path("data/squad.json")
+SYNC_STATE_FILE = Path("sync_state.json")
+OCAP_CACHE_PATH = Path("cache")
+BACKFILL_CHECKPOINT_FILE = Path("backfill_checkpoint.json")
 
-mongo_client = MongoClient("mongodb://localhost:27017")  
-db = mongo_client["stat"]      
+# Подключение к Mongo создается при первом обращении к коллекции (module.mongo), а не при импорте config.
+MONGO_URI = "mongodb://localhost:27017"
+db = LazyDatabase(MONGO_URI, "stat")
 collection = db["misssion_stat"]
+leaderboard_collection = db["leaderboard"]
+jobs_collection = db["ocap_jobs"]
+heatmaps_collection = db["heatmaps"]
+heatmap_missions_collection = db["heatmap_missions"]
+timelines_collection = db["timelines"]
+kills_collection = db["kills"]
+
+DOWNLOAD_DATE = "2025-08-23"
+
+# Запись миссий в Mongo: сколько документов копить до bulk_write и с каким write concern писать.
+MONGO_BATCH_SIZE = 20
+MONGO_WRITE_CONCERN = {"w": 1}
+
+# Число процессов для разбора миссий. 1 - последовательная обработка в текущем процессе.
+PROCESS_WORKERS = 1
+# Число процессов, разбирающих сущности внутри одного файла (OCAP.from_file(parse_workers=...)).
+# Для больших записей при PROCESS_WORKERS = 1; вместе с пулом миссий только отнимает ядра.
+PARSE_WORKERS = 1
+
+# Сборка моделей OCAP без валидации pydantic (OCAP.from_file(trusted=True)). Быстрее, но битый файл
+# с сервера не будет отвергнут при разборе.
+OCAP_TRUSTED_INPUT = False
+
+# Лимит анонимной памяти процесса на разбор одной миссии в байтах (module.track_spill.MemoryGuard).
+# С половины лимита колонки позиций выгружаются в файл под TEMP_PATH, при превышении лимита разбор
+# миссии прерывается ошибкой и файл остается необработанным. None - без ограничения.
+OCAP_MEMORY_BUDGET = None
+
+# Кэш разобранных миссий (module.ocap_cache) и предельный размер его каталога в байтах.
+OCAP_CACHE_ENABLED = True
+OCAP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Как часто пересчет (logic.backfill) печатает скорость, в секундах.
+BACKFILL_REPORT_SECONDS = 10.0
+
+# Сколько проходов подряд повторять файл, который не скачался или не обработался.
+SYNC_MAX_ATTEMPTS = 5
+
+# За сколько дней до самой новой операции помнить уже учтенные файлы: операция, появившаяся в списке
+# задним числом в пределах окна, будет скачана, более старые считаются учтенными.
+SYNC_WINDOW_DAYS = 14
+
+# Тепловые карты (logic.heatmaps): сторона квадрата карты и клетки сетки в метрах, каждый какой кадр
+# брать для карты присутствия игроков. Точки за пределами HEATMAP_WORLD_SIZE не учитываются.
+HEATMAPS_ENABLED = True
+HEATMAP_WORLD_SIZE = 40960
+HEATMAP_CELL_SIZE = 128
+HEATMAP_SAMPLE_FRAMES = 10
+
+# Шкала миссии (logic.timeline): живые игроки сторон, убийства и потери ТС с точкой на каждый
+# TIMELINE_STEP_FRAMES-й кадр.
+TIMELINES_ENABLED = True
+TIMELINE_STEP_FRAMES = 30
+
+# Убийства хранятся по одному документу в коллекции kills (logic.kills). True - дополнительно писать
+# прежние списки victims_players и destroyed_vehicles в документ миссии, для потребителей, которые
+# еще читают их оттуда.
+MISSION_EMBED_KILLS = False
+
+# Очередь заданий для обработки на нескольких машинах (logic.jobs): аренда задания и как часто ее продлевать,
+# сколько попыток дается файлу, пауза перед повтором упавшего задания и опрос пустой очереди, в секундах.
+JOB_LEASE_SECONDS = 300
+JOB_HEARTBEAT_SECONDS = 60
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_SECONDS = 60
+JOB_POLL_SECONDS = 10
+
+# Планировщик загрузки (logic.scheduler): пауза между опросами сервера вне игр и в игровые вечера
+# (часы начала и конца вечера), первая пауза после ошибки и ее предел, доля случайного разброса пауз,
+# размер очереди между загрузкой и обработкой, слежение за OCAPS_PATH и период его опроса, в секундах.
+SCHEDULER_IDLE_SECONDS = 600
+SCHEDULER_GAME_NIGHT_SECONDS = 60
+SCHEDULER_GAME_NIGHT_HOURS = (16, 4)
+# Дни недели игровых вечеров (0 - понедельник): вт-ср IF, чт-сб ТВТ. В воскресенье и понедельник вечеров нет,
+# воскресные часы до SCHEDULER_GAME_NIGHT_HOURS[1] относятся к субботнему вечеру.
+SCHEDULER_GAME_NIGHT_DAYS = (1, 2, 3, 4, 5)
+SCHEDULER_ERROR_SECONDS = 10
+SCHEDULER_MAX_BACKOFF_SECONDS = 900
+SCHEDULER_JITTER = 0.2
+SCHEDULER_QUEUE_SIZE = 8
+SCHEDULER_WATCH = False
+SCHEDULER_WATCH_SECONDS = 5
+
+# Загрузка OCAP: одновременных соединений, запросов в секунду, таймаут запроса в секундах.
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_RATE = 1.0
+DOWNLOAD_TIMEOUT = 60.0
+
+# Метрики обработки (module.metrics): файл в текстовом формате Prometheus для textfile collector
+# и структурированный лог JSON Lines. None - не писать.
+METRICS_FILE = Path("metrics.prom")
+METRICS_LOG_FILE = Path("metrics.jsonl")
+# Пик аллокаций Python на каждую миссию через tracemalloc. Заметно замедляет разбор.
+METRICS_TRACE_MEMORY = False
+# Имя файла OCAP, разбор которого снять cProfile, и каталог для дампов .prof.
+PROFILE_OCAP = None
+PROFILE_PATH = Path("profiles")
+
+# Сколько разобранных ников держать в памяти (logic.name_logic.SquadResolver).
+NICKNAME_CACHE_SIZE = 4096
 
-DOWNLOAD_DATE = "2025-08-23"
\ No newline at end of file
+# Архив OCAP: None - хранить JSON как есть, "gzip" или "zstd" (нужен пакет zstandard) - сжимать при загрузке.
+# Чтение прозрачное при любом значении: формат файла определяется по содержимому, имя не меняется.
+# Уже скачанные файлы переводятся командой python -m logic.archive.
+OCAP_ARCHIVE_COMPRESSION = None
+OCAP_ARCHIVE_LEVEL = None  # None - уровень по умолчанию для выбранного сжатия.
@@ -0,0 +1,111 @@
+import argparse
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from config import *
+from logic.backfill import select_ocaps
+from module.ocap_archive import COMPRESSIONS, OcapArchiveError, detect_compression, read_through, recompress_file
+
+MB = 1024 ** 2
+
+
+def _format_name(compression: str | None) -> str:
+    return compression or "json"
+
+
+def migrate(ocap_files: list[Path], compression: str | None, level: int | None = None) -> dict:
+    """
+    Переводит файлы архива в compression (None - обратно в JSON). Файлы, уже лежащие в нужном формате,
+    пропускаются, так что прерванную миграцию можно просто запустить снова.
+    Возвращает суммарные размеры и время записи и проверочного чтения.
+    """
+    totals = dict.fromkeys(
+        ("files", "skipped", "raw_bytes", "before_bytes", "stored_bytes", "write_seconds", "read_seconds"), 0.0,
+    )
+    failed = []
+    for n, ocap_file in enumerate(ocap_files, 1):
+        if detect_compression(ocap_file) == compression:
+            totals["skipped"] += 1
+            continue
+        try:
+            result = recompress_file(ocap_file, compression, level)
+        except (OSError, EOFError, OcapArchiveError) as e:
+            print(f"Ошибка перепаковки {ocap_file.name}: {e}")
+            failed.append(ocap_file.name)
+            continue
+        totals["files"] += 1
+        for key, value in result.items():
+            totals[key] += value
+        print(
+            f"{n}/{len(ocap_files)} {ocap_file.name}: {result['before_bytes'] / MB:.1f} -> "
+            f"{result['stored_bytes'] / MB:.1f} МБ"
+        )
+    return {**totals, "failed": failed}
+
+
+def archive_stats(ocap_files: list[Path]) -> dict[str, dict]:
+    """Размер на диске, размер JSON и скорость чтения через open_ocap по форматам хранения."""
+    stats: dict[str, dict] = defaultdict(lambda: defaultdict(float))
+    for ocap_file in ocap_files:
+        row = stats[_format_name(detect_compression(ocap_file))]
+        started = time.perf_counter()
+        raw_size, _ = read_through(ocap_file)
+        row["read_seconds"] += time.perf_counter() - started
+        row["files"] += 1
+        row["raw_bytes"] += raw_size
+        row["stored_bytes"] += ocap_file.stat().st_size
+    return stats
+
+
+def _print_ratio(title: str, raw_bytes: float, stored_bytes: float, read_seconds: float) -> None:
+    ratio = raw_bytes / stored_bytes if stored_bytes else 0.0
+    speed = raw_bytes / MB / read_seconds if read_seconds else 0.0
+    print(
+        f"{title}: JSON {raw_bytes / MB:.1f} МБ, на диске {stored_bytes / MB:.1f} МБ, "
+        f"сжатие {ratio:.2f}x, чтение {speed:.1f} МБ/с JSON"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сжатие архива OCAP")
+    parser.add_argument("command", choices=["migrate", "stats"])
+    parser.add_argument(
+        "--compression",
+        choices=[*COMPRESSIONS, "none"],
+        help="Формат для migrate, по умолчанию OCAP_ARCHIVE_COMPRESSION; none - распаковать обратно в JSON",
+    )
+    parser.add_argument("--level", type=int, default=OCAP_ARCHIVE_LEVEL)
+    parser.add_argument("--from", dest="date_from", help="Первая дата миссии, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="Последняя дата миссии, YYYY-MM-DD")
+    parser.add_argument("--glob", dest="pattern", help="Шаблон имени файла")
+    args = parser.parse_args()
+
+    files = select_ocaps(date_from=args.date_from, date_to=args.date_to, pattern=args.pattern)
+
+    if args.command == "stats":
+        for format_name, row in sorted(archive_stats(files).items()):
+            _print_ratio(f"{format_name} ({int(row['files'])} файлов)", row["raw_bytes"], row["stored_bytes"], row["read_seconds"])
+        sys.exit(0)
+
+    target = args.compression or OCAP_ARCHIVE_COMPRESSION
+    if target is None:
+        print("Сжатие не задано: укажите --compression или OCAP_ARCHIVE_COMPRESSION в config.py")
+        sys.exit(2)
+    target = None if target == "none" else target
+
+    started = time.perf_counter()
+    summary = migrate(files, target, args.level)
+    elapsed = time.perf_counter() - started
+    print(f"Перепаковано: {int(summary['files'])}, уже в формате {_format_name(target)}: {int(summary['skipped'])}")
+    if summary["files"]:
+        print(
+            f"Было {summary['before_bytes'] / MB:.1f} МБ, стало {summary['stored_bytes'] / MB:.1f} МБ, "
+            f"запись {summary['raw_bytes'] / MB / max(summary['write_seconds'], 1e-9):.1f} МБ/с JSON, "
+            f"всего {elapsed:.1f} с"
+        )
+        _print_ratio("Итог", summary["raw_bytes"], summary["stored_bytes"], summary["read_seconds"])
+    if summary["failed"]:
+        print(f"Не удалось перепаковать: {', '.join(summary['failed'])}")
+        sys.exit(1)
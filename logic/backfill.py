@@ -0,0 +1,149 @@
+import argparse
+import fnmatch
+import os
+import time
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from config import *
+from logic.mission_pars import build_missions, clear_temp, export_metrics, get_file_date
+from logic.storage import MissionWriter
+from module.ocap_models import get_game_type_from_file
+
+
+class BackfillCheckpoint(BaseModel):
+    """Прогресс пересчета: выборка, для которой он начат, и уже записанные файлы."""
+    selection: dict = {}
+    done: list[str] = []
+
+    @classmethod
+    def load(cls, path: Path = BACKFILL_CHECKPOINT_FILE) -> "BackfillCheckpoint":
+        if path.exists():
+            return cls.model_validate_json(path.read_text(encoding="utf-8"))
+        return cls()
+
+    def save(self, path: Path = BACKFILL_CHECKPOINT_FILE) -> None:
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.model_dump_json(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def select_ocaps(
+        date_from: str | None = None,
+        date_to: str | None = None,
+        game_type: str | None = None,
+        pattern: str | None = None,
+        ocaps_path: Path = OCAPS_PATH,
+) -> list[Path]:
+    """Файлы OCAP по диапазону дат (включительно, YYYY-MM-DD), типу игры и glob-шаблону имени."""
+    date_from = date_from.replace("-", "_") if date_from else None
+    date_to = date_to.replace("-", "_") if date_to else None
+
+    if not ocaps_path.exists():
+        return []
+    selected = []
+    for ocap_file in sorted(ocaps_path.iterdir()):
+        if not ocap_file.is_file() or ocap_file.name.startswith("."):
+            continue
+        if pattern and not fnmatch.fnmatch(ocap_file.name, pattern):
+            continue
+        file_date = get_file_date(ocap_file)
+        if date_from and file_date < date_from or date_to and file_date > date_to:
+            continue
+        if game_type:
+            try:
+                if get_game_type_from_file(ocap_file) != game_type:
+                    continue
+            except ValueError:
+                continue
+        selected.append(ocap_file)
+    return selected
+
+
+def backfill(
+        ocap_files: list[Path],
+        selection: dict,
+        workers: int = PROCESS_WORKERS,
+        batch_size: int = MONGO_BATCH_SIZE,
+        restart: bool = False,
+        checkpoint_path: Path = BACKFILL_CHECKPOINT_FILE,
+        report_every: float = BACKFILL_REPORT_SECONDS,
+) -> list[Path]:
+    """
+    Пересчитывает и перезаписывает документы миссий для ocap_files.
+    Записанные файлы отмечаются в чекпоинте после каждой пачки, так что после падения
+    повторный запуск с той же выборкой продолжит с места остановки.
+    Документ заменяется целиком одним upsert, таблицы игроков корректируются на разницу.
+    Возвращает файлы, которые не удалось обработать.
+    """
+    checkpoint = BackfillCheckpoint.load(checkpoint_path)
+    if restart or checkpoint.selection != selection:
+        checkpoint = BackfillCheckpoint(selection=selection)
+    done = set(checkpoint.done)
+    todo = [f for f in ocap_files if f.name not in done]
+    print(f"К пересчету: {len(todo)} из {len(ocap_files)} (уже готово: {len(ocap_files) - len(todo)}).")
+
+    failed = []
+    batch: list[str] = []
+    started = last_report = time.monotonic()
+    processed, processed_bytes = 0, 0
+
+    def commit_batch() -> None:
+        writer.flush()
+        checkpoint.done.extend(batch)
+        checkpoint.save(checkpoint_path)
+        batch.clear()
+
+    with MissionWriter(batch_size=batch_size) as writer:
+        for ocap_file, result in build_missions(todo, workers):
+            processed += 1
+            processed_bytes += ocap_file.stat().st_size
+            if isinstance(result, Exception):
+                print(f"Ошибка обработки {ocap_file.name}: {result}")
+                failed.append(ocap_file)
+            else:
+                writer.add(result)
+                batch.append(ocap_file.name)
+                if len(batch) >= batch_size:
+                    commit_batch()
+
+            now = time.monotonic()
+            if now - last_report >= report_every or processed == len(todo):
+                last_report = now
+                elapsed = max(now - started, 1e-9)
+                print(
+                    f"{processed}/{len(todo)}: {processed / elapsed:.2f} миссий/с, "
+                    f"{processed_bytes / elapsed / 1024 ** 2:.1f} МБ/с"
+                )
+        commit_batch()
+
+    clear_temp()
+    export_metrics()
+    return failed
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Пересчет статистики уже загруженных миссий")
+    parser.add_argument("--from", dest="date_from", help="Первая дата миссии, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="Последняя дата миссии, YYYY-MM-DD")
+    parser.add_argument("--game-type", help="ltvt, tvt1, tvt2, if, unknown")
+    parser.add_argument("--glob", dest="pattern", help="Шаблон имени файла, например '*_LTVT*'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--restart", action="store_true", help="Начать заново, игнорируя чекпоинт")
+    args = parser.parse_args(argv)
+
+    selection = {
+        "date_from": args.date_from,
+        "date_to": args.date_to,
+        "game_type": args.game_type,
+        "pattern": args.pattern,
+    }
+    files = select_ocaps(**selection)
+    failed_files = backfill(files, selection, workers=args.workers, restart=args.restart)
+    if failed_files:
+        print(f"Не удалось пересчитать: {', '.join(f.name for f in failed_files)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from typing import Iterator
+
+from pymongo import ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+# Отметка документа, чей вклад в сводные счетчики (таблицы, тепловые карты) еще не учтен.
+# Такой документ не считается обработанным, а при перезаписи вычитается не он, а APPLIED_FIELD.
+PENDING_FIELD = "rollup_pending"
+
+# Номер версии документа. Перезапись условна по версии и отметке, прочитанным вместе с прежним документом.
+REVISION_FIELD = "revision"
+
+# Вклад, который уже учтен в счетчиках, пока отмеченная версия его не заменила: его вычтет тот, кто снимет отметку.
+# Без него повторная запись поверх неучтенной версии не знала бы, что вычитать.
+APPLIED_FIELD = "rollup_applied"
+
+_SERVICE_FIELDS = ("_id", PENDING_FIELD, REVISION_FIELD, APPLIED_FIELD)
+
+
+def _applied(prev: dict | None) -> dict | None:
+    """Учтенный в счетчиках вклад файла: сама прежняя версия или то, что она еще не заменила."""
+    if prev is None:
+        return None
+    if prev.get(PENDING_FIELD):
+        return prev.get(APPLIED_FIELD)
+    return {k: v for k, v in prev.items() if k not in _SERVICE_FIELDS}
+
+
+def applied_versions(coll: Collection, projection: dict) -> Iterator[dict]:
+    """Вклад каждого файла, который сейчас учтен в счетчиках, - по нему счетчики пересчитываются и сверяются."""
+    for doc in coll.find({}, {**projection, PENDING_FIELD: 1, APPLIED_FIELD: 1}):
+        applied = _applied(doc)
+        if applied is not None:
+            yield applied
+
+
+def write_versions(
+        coll: Collection,
+        docs: list[dict],
+        projection: dict,
+) -> tuple[list[dict], dict[str, dict], BulkWriteError | None]:
+    """
+    Записывает новые версии документов (по file) с отметкой PENDING_FIELD.
+    Если прежнюю версию за это время переписал или учел другой процесс, замена не находит ее
+    и упирается в уникальный индекс по file - такой документ попадает в ошибку и не записывается.
+    Возвращает записанные документы, учтенный вклад их прежних версий (его надо вычесть) и ошибку записи остальных.
+    """
+    previous = {
+        p["file"]: p
+        for p in coll.find(
+            {"file": {"$in": [d["file"] for d in docs]}}, {**projection, PENDING_FIELD: 1, REVISION_FIELD: 1, APPLIED_FIELD: 1},
+        )
+    }
+    versions, requests = [], []
+    for doc in docs:
+        prev = previous.get(doc["file"])
+        condition = {"file": doc["file"], REVISION_FIELD: None}
+        if prev is not None:
+            condition[REVISION_FIELD] = prev.get(REVISION_FIELD)
+            condition[PENDING_FIELD] = True if prev.get(PENDING_FIELD) else {"$ne": True}
+        version = {
+            **doc,
+            PENDING_FIELD: True,
+            REVISION_FIELD: ((prev or {}).get(REVISION_FIELD) or 0) + 1,
+            APPLIED_FIELD: _applied(prev),
+        }
+        versions.append(version)
+        requests.append(ReplaceOne(condition, version, upsert=True))
+
+    error = None
+    try:
+        coll.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        error = e
+    failed = {versions[err["index"]]["file"] for err in error.details["writeErrors"]} if error else set()
+    written = [v for v in versions if v["file"] not in failed]
+    removed = {v["file"]: v[APPLIED_FIELD] for v in written if v[APPLIED_FIELD] is not None}
+    return written, removed, error
+
+
+def claim_versions(coll: Collection, written: list[dict]) -> list[dict]:
+    """
+    Снимает отметку со своих версий; вклад учитывает только тот, кто ее снял. Версию, которую уже
+    переписал другой процесс, снять нельзя - ее вклад не учитывается, а тот процесс не вычтет его.
+    Отметка снимается до обновления счетчиков: если обновление упало, ее возвращает release_versions,
+    а падение процесса между ними теряет вклад, а не удваивает его, и находится сверкой (leaderboard check).
+    """
+    return [
+        doc for doc in written
+        if coll.update_one(
+            {"file": doc["file"], REVISION_FIELD: doc[REVISION_FIELD], PENDING_FIELD: True},
+            {"$unset": {PENDING_FIELD: "", APPLIED_FIELD: ""}},
+        ).matched_count == 1
+    ]
+
+
+def release_versions(coll: Collection, claimed: list[dict]) -> None:
+    """
+    Возвращает отметку (и прежний учтенный вклад) версиям, чей вклад не удалось учесть,
+    чтобы повтор учел его заново.
+    """
+    for doc in claimed:
+        coll.update_one(
+            {"file": doc["file"], REVISION_FIELD: doc[REVISION_FIELD], PENDING_FIELD: {"$exists": False}},
+            {"$set": {PENDING_FIELD: True, APPLIED_FIELD: doc[APPLIED_FIELD]}},
+        )
@@ -1,56 +1,77 @@
-import os
-import json
 import requests
 from pathlib import Path
-from time import sleep
 from datetime import datetime
 
-from logic.mission_pars import process_ocap 
+from logic.mission_pars import export_metrics, process_ocaps
+from logic.ocap_downloader import download_ocaps_sync
+from logic.sync_state import SyncState
 from config import *
+from module.metrics import count, stage
 
-OCAPS_PATH.mkdir(exist_ok=True)
-TEMP_PATH.mkdir(exist_ok=True)
 
+def list_new_filenames(state: SyncState) -> list[str]:
+    """
+    Имена операций, появившихся после курсора state (курсор сдвигается), и файлов из state.pending.
+    Если список операций не менялся (304), сам список повторно не разбирается.
+    """
+    filtered_ocaps = []
+    with stage("listing"):
+        response = requests.get(OCAPS_URL, headers=state.conditional_headers())
+        if response.status_code == 304:
+            print("Список операций не изменился.")
+        else:
+            response.raise_for_status()
+            ocaps_list = response.json()
+            state.etag = response.headers.get("ETag")
+            state.last_modified = response.headers.get("Last-Modified")
+            count(listing_bytes=len(response.content), listed_operations=len(ocaps_list))
+
+            min_date_dt = datetime.strptime(DOWNLOAD_DATE, "%Y-%m-%d")
+            filtered_ocaps = [
+                o for o in ocaps_list
+                if datetime.strptime(o["date"], "%Y-%m-%d") >= min_date_dt and state.is_new(o)
+            ]
+            state.advance(ocaps_list)
+            filtered_ocaps.sort(key=lambda x: (x["date"], x["filename"]), reverse=True)
 
-def download_new_ocaps():
-    response = requests.get(OCAPS_URL)
-    response.raise_for_status()
-    ocaps_list = response.json()
+    filenames = [o["filename"] for o in filtered_ocaps]
+    filenames += [filename for filename in state.pending if filename not in filenames]
+    return filenames
 
-    min_date_dt = datetime.strptime(DOWNLOAD_DATE, "%Y-%m-%d")
-    filtered_ocaps = [o for o in ocaps_list if datetime.strptime(o["date"], "%Y-%m-%d") >= min_date_dt]
 
-    if not filtered_ocaps:
+def download_new_ocaps(state: SyncState) -> list[Path]:
+    """
+    Скачивает операции, появившиеся после курсора state, и докачивает файлы из state.pending.
+    Возвращает пути новых и отложенных файлов; не скачавшиеся файлы на диске отсутствуют.
+    """
+    filenames = list_new_filenames(state)
+    if not filenames:
         print("Новых миссий не найдено.")
         return []
 
-    filtered_ocaps.sort(key=lambda x: (x["date"], x["filename"]), reverse=True)
+    missing = []
+    for filename in filenames:
+        if (OCAPS_PATH / filename).exists():
+            print(f"Уже скачано: {filename}")
+        else:
+            missing.append(filename)
+    with stage("download"):
+        download_ocaps_sync(missing)
 
-    local_files = set(os.listdir(OCAPS_PATH))
-    downloaded_files = []
+    return [OCAPS_PATH / filename for filename in filenames]
 
-    for ocap in filtered_ocaps:
-        filename = ocap["filename"]
-        filepath = OCAPS_PATH / filename
-        if filename not in local_files:
-            print(f"Скачиваем: {filename}")
-            r = requests.get(OCAP_URL % filename)
-            r.raise_for_status()
-            filepath.write_text(r.text, encoding="utf-8")
-            sleep(1)
-        else:
-            print(f"Уже скачано: {filename}")
-        downloaded_files.append(filepath)
 
-    return downloaded_files
+def main(workers: int = PROCESS_WORKERS):
+    try:
+        state = SyncState.load()
+        new_ocaps = download_new_ocaps(state)
+        failed = process_ocaps([p for p in new_ocaps if p.exists()], workers)
+        # Не скачавшиеся и упавшие при обработке файлы повторяются на следующем проходе.
+        state.set_pending([p.name for p in new_ocaps if not p.exists() or p in failed])
+        state.save()
+    finally:
+        export_metrics()
 
-def main():
-    new_ocaps = download_new_ocaps()
-    if not new_ocaps:
-        return
-    for ocap_file in new_ocaps:
-        print(f"Обрабатываем: {ocap_file.name}")
-        process_ocap(ocap_file)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+import argparse
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+from pymongo.collection import Collection
+
+from config import *
+from logic.contribution import applied_versions, claim_versions, release_versions, write_versions
+from logic.leaderboard import mission_month
+from module.heatmap import LAYERS, from_cells, grid_side, mission_grids, to_cells
+
+# Поле документа миссии, в котором вклад в тепловые карты идет от разбора до MissionWriter.
+# В коллекцию миссий оно не пишется.
+HEATMAP_FIELD = "heatmap"
+
+HEATMAP_INDEXES = [
+    (
+        [("world", ASCENDING), ("game_type", ASCENDING), ("month", ASCENDING), ("layer", ASCENDING),
+         ("cell_size", ASCENDING)],
+        {"unique": True},
+    ),
+]
+HEATMAP_MISSION_INDEXES = [
+    ([("file", ASCENDING)], {"unique": True}),
+]
+
+# Поля вклада миссии, нужные, чтобы вычесть его из сводных сеток.
+HEATMAP_PROJECTION = {
+    "_id": 0, "file": 1, "world": 1, "game_type": 1, "month": 1, "world_size": 1, "cell_size": 1, "layers": 1,
+}
+
+
+def mission_heatmap(ocap: Any, data: dict) -> dict:
+    """Вклад миссии в тепловые карты: разреженные сетки по слоям и срез, к которому они относятся."""
+    grids = mission_grids(ocap, HEATMAP_WORLD_SIZE, HEATMAP_CELL_SIZE, HEATMAP_SAMPLE_FRAMES)
+    return {
+        "file": data["file"],
+        "world": data.get("worldName"),
+        "game_type": data.get("game_type"),
+        "month": mission_month(data),
+        "world_size": HEATMAP_WORLD_SIZE,
+        "cell_size": HEATMAP_CELL_SIZE,
+        "layers": {layer: to_cells(grid) for layer, grid in grids.items()},
+    }
+
+
+def heatmap_updates(added: list[dict], removed: list[dict] = ()) -> list[UpdateOne]:
+    """
+    $inc-обновления сводных сеток по клеткам. Вклад removed вычитается,
+    так что перезапись миссии заменяет ее прежний вклад, а не добавляет его второй раз.
+    """
+    total: dict[tuple, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    world_sizes = {}
+    for sign, heatmaps in ((1, added), (-1, removed)):
+        for heatmap in heatmaps:
+            for layer, sparse in heatmap["layers"].items():
+                slice_key = (heatmap["world"], heatmap["game_type"], heatmap["month"], layer, heatmap["cell_size"])
+                world_sizes[slice_key] = heatmap["world_size"]
+                cells = total[slice_key]
+                for cell, value in zip(sparse["cells"], sparse["counts"]):
+                    cells[cell] += sign * value
+
+    updates = []
+    for slice_key, cells in total.items():
+        inc = {f"cells.{cell}": value for cell, value in cells.items() if value}
+        if not inc:
+            continue
+        world, game_type, month, layer, cell_size = slice_key
+        updates.append(UpdateOne(
+            {"world": world, "game_type": game_type, "month": month, "layer": layer, "cell_size": cell_size},
+            {"$inc": inc, "$set": {"world_size": world_sizes[slice_key]}},
+            upsert=True,
+        ))
+    return updates
+
+
+def store_heatmaps(
+        heatmaps: list[dict],
+        coll: Collection = heatmaps_collection,
+        missions_coll: Collection = heatmap_missions_collection,
+) -> None:
+    """
+    Сохраняет вклад миссий и обновляет сводные сетки с учетом прежнего вклада тех же файлов.
+    Вклад пишется версией с отметкой, как документ миссии (logic.contribution): сетки обновляет только тот,
+    кто снял отметку, а если обновление упало, отметка возвращается и повтор учтет вклад заново.
+    """
+    if not heatmaps:
+        return
+    written, removed, error = write_versions(missions_coll, heatmaps, HEATMAP_PROJECTION)
+    claimed = claim_versions(missions_coll, written)
+    previous = [removed[h["file"]] for h in claimed if h["file"] in removed]
+    updates = heatmap_updates(claimed, previous)
+    try:
+        if updates:
+            coll.bulk_write(updates, ordered=False)
+    except Exception:
+        release_versions(missions_coll, claimed)
+        raise
+    if error:
+        raise error
+
+
+def get_heatmap(
+        world: str,
+        layer: str,
+        game_type: str | None = None,
+        month_from: str | None = None,
+        month_to: str | None = None,
+        cell_size: int = HEATMAP_CELL_SIZE,
+        coll: Collection = heatmaps_collection,
+) -> np.ndarray:
+    """Сетка слоя по карте за период (месяцы вида 2025-08, границы включительно) - сумма помесячных сеток."""
+    match: dict[str, Any] = {"world": world, "layer": layer, "cell_size": cell_size}
+    if game_type is not None:
+        match["game_type"] = game_type
+    months = {}
+    if month_from is not None:
+        months["$gte"] = month_from
+    if month_to is not None:
+        months["$lte"] = month_to
+    if months:
+        match["month"] = months
+
+    grid = None
+    for doc in coll.find(match, {"cells": 1, "world_size": 1}):
+        cells = doc.get("cells", {})
+        part = from_cells(map(int, cells), cells.values(), grid_side(doc["world_size"], cell_size))
+        grid = part if grid is None else grid + part
+    if grid is None:
+        side = grid_side(HEATMAP_WORLD_SIZE, cell_size)
+        grid = np.zeros((side, side), dtype=np.int64)
+    return grid
+
+
+def rebuild_heatmaps(
+        coll: Collection = heatmaps_collection,
+        missions_coll: Collection = heatmap_missions_collection,
+) -> int:
+    """
+    Полный пересчет сводных сеток по сохраненному вкладу миссий. Возвращает число записанных срезов.
+    Для версии с неснятой отметкой берется прежний учтенный вклад: новый учтет повторная запись миссии.
+    """
+    coll.delete_many({})
+    updates = heatmap_updates(list(applied_versions(missions_coll, HEATMAP_PROJECTION)))
+    if updates:
+        coll.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def ensure_heatmap_indexes(
+        coll: Collection = heatmaps_collection,
+        missions_coll: Collection = heatmap_missions_collection,
+) -> None:
+    for keys, options in HEATMAP_INDEXES:
+        coll.create_index(keys, **options)
+    for keys, options in HEATMAP_MISSION_INDEXES:
+        missions_coll.create_index(keys, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Тепловые карты убийств и присутствия игроков")
+    parser.add_argument("command", choices=["export", "rebuild"])
+    parser.add_argument("--world", help="export: карта (worldName)")
+    parser.add_argument("--layer", choices=LAYERS, default=LAYERS[0])
+    parser.add_argument("--game-type")
+    parser.add_argument("--from", dest="month_from", help="Первый месяц, YYYY-MM")
+    parser.add_argument("--to", dest="month_to", help="Последний месяц, YYYY-MM")
+    parser.add_argument("--output", type=Path, help="export: файл .npy")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Пересчитано срезов: {rebuild_heatmaps()}")
+    else:
+        if not args.world or not args.output:
+            parser.error("для export нужны --world и --output")
+        heatmap = get_heatmap(args.world, args.layer, args.game_type, args.month_from, args.month_to)
+        np.save(args.output, heatmap)
+        print(f"{args.world} {args.layer}: {int(heatmap.sum())} точек, сетка {heatmap.shape[0]}x{heatmap.shape[1]}")
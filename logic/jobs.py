@@ -0,0 +1,307 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from config import *
+from logic.download_mission import list_new_filenames
+from logic.mission_pars import export_metrics, process_ocap
+from logic.ocap_downloader import download_ocaps_sync
+from logic.storage import ensure_indexes
+from logic.sync_state import SyncState
+from module.metrics import REGISTRY, log_event
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JOB_INDEXES = [
+    ([("status", ASCENDING), ("lease_until", ASCENDING)], {}),
+]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Очередь файлов OCAP в Mongo. _id задания - имя файла, поэтому повторная постановка ничего не дублирует.
+    Воркер забирает задание атомарным find_one_and_update и получает аренду до lease_until, которую
+    продлевает, пока обрабатывает файл. Задание с истекшей арендой (воркер упал или завис) снова достается
+    любому воркеру; после max_attempts попыток задание остается в статусе failed.
+    Время аренды считается по часам воркеров, поэтому часы машин должны быть синхронизированы (NTP).
+    """
+
+    def __init__(
+            self,
+            coll: Collection = jobs_collection,
+            lease_seconds: float = JOB_LEASE_SECONDS,
+            max_attempts: int = JOB_MAX_ATTEMPTS,
+            retry_seconds: float = JOB_RETRY_SECONDS,
+    ):
+        self.collection = coll
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.retry = timedelta(seconds=retry_seconds)
+
+    def ensure_indexes(self) -> None:
+        for keys, options in JOB_INDEXES:
+            self.collection.create_index(keys, **options)
+
+    def enqueue(self, filenames: list[str]) -> int:
+        """Ставит файлы в очередь. Уже известные очереди файлы не трогаются. Возвращает число новых заданий."""
+        if not filenames:
+            return 0
+        now = _now()
+        requests = [
+            UpdateOne(
+                {"_id": filename},
+                {"$setOnInsert": {"status": PENDING, "attempts": 0, "lease_until": now, "enqueued_at": now}},
+                upsert=True,
+            )
+            for filename in filenames
+        ]
+        return self.collection.bulk_write(requests, ordered=False).upserted_count
+
+    def claim(self, worker_id: str) -> dict | None:
+        """Забирает ждущее задание или задание с истекшей арендой. None - забирать нечего."""
+        now = _now()
+        return self.collection.find_one_and_update(
+            {
+                "status": {"$in": [PENDING, RUNNING]},
+                "lease_until": {"$lte": now},
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {"status": RUNNING, "owner": worker_id, "lease_until": now + self.lease, "claimed_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("lease_until", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _owned(self, job_id: str, worker_id: str) -> dict:
+        return {"_id": job_id, "owner": worker_id, "status": RUNNING}
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Продлевает аренду. False - задание уже забрал другой воркер."""
+        result = self.collection.update_one(
+            self._owned(job_id, worker_id), {"$set": {"lease_until": _now() + self.lease}},
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        result = self.collection.update_one(
+            self._owned(job_id, worker_id),
+            {"$set": {"status": DONE, "finished_at": _now(), "error": None}},
+        )
+        return result.matched_count == 1
+
+    def fail(self, job: dict, worker_id: str, error: str) -> None:
+        """Упавшее задание повторяется через retry_seconds, пока не кончатся попытки."""
+        status = FAILED if job["attempts"] >= self.max_attempts else PENDING
+        self.collection.update_one(
+            self._owned(job["_id"], worker_id),
+            {"$set": {"status": status, "error": error, "lease_until": _now() + self.retry}},
+        )
+
+    def reap(self) -> int:
+        """Задания, у которых аренда истекла на последней попытке, помечаются failed."""
+        result = self.collection.update_many(
+            {"status": RUNNING, "lease_until": {"$lte": _now()}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": FAILED, "error": "Аренда истекла на последней попытке"}},
+        )
+        return result.modified_count
+
+    def retry_failed(self) -> int:
+        """Возвращает задания failed в очередь с новым запасом попыток."""
+        result = self.collection.update_many(
+            {"status": FAILED}, {"$set": {"status": PENDING, "attempts": 0, "lease_until": _now()}},
+        )
+        return result.modified_count
+
+    def stats(self) -> dict[str, int]:
+        counts = dict.fromkeys((PENDING, RUNNING, DONE, FAILED), 0)
+        for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+
+@contextmanager
+def keep_lease(queue: JobQueue, job_id: str, worker_id: str, interval: float) -> Iterator[threading.Event]:
+    """Продлевает аренду задания в фоновом потоке. Выставленное событие - аренда потеряна."""
+    stop, lost = threading.Event(), threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(interval):
+            try:
+                if not queue.heartbeat(job_id, worker_id):
+                    lost.set()
+                    return
+            except PyMongoError as e:
+                # Аренду продлим на следующем такте, запаса lease_seconds на это хватает.
+                print(f"Не удалось продлить аренду {job_id}: {e}")
+
+    thread = threading.Thread(target=beat, name=f"lease-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_job(filename: str) -> None:
+    """Обработка задания: файл скачивается, если его еще нет на этой машине, и обрабатывается process_ocap."""
+    ocap_file = OCAPS_PATH / filename
+    if not ocap_file.exists():
+        download_ocaps_sync([filename])
+    if not ocap_file.exists():
+        raise RuntimeError(f"Файл {filename} не скачался")
+    process_ocap(ocap_file)
+
+
+def run_worker(
+        queue: JobQueue | None = None,
+        handler: Callable[[str], None] = process_job,
+        worker_id: str | None = None,
+        poll_seconds: float | None = JOB_POLL_SECONDS,
+        heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+) -> int:
+    """
+    Цикл воркера: забрать задание, обработать под продлеваемой арендой, отметить результат.
+    При poll_seconds=None воркер завершается, как только очередь опустела.
+    Сбой Mongo при работе с очередью не останавливает воркер: он ждет и пробует снова.
+    Возвращает число успешно обработанных заданий.
+    """
+    queue = queue or JobQueue()
+    worker_id = worker_id or default_worker_id()
+    done = 0
+    while True:
+        try:
+            job = queue.claim(worker_id)
+            if job is None:
+                queue.reap()
+        except PyMongoError as e:
+            print(f"Очередь недоступна: {e}")
+            REGISTRY.inc("job_queue_errors_total")
+            time.sleep(poll_seconds or JOB_POLL_SECONDS)
+            continue
+
+        if job is None:
+            if poll_seconds is None:
+                return done
+            time.sleep(poll_seconds)
+            continue
+
+        filename = job["_id"]
+        started = time.perf_counter()
+        with keep_lease(queue, filename, worker_id, heartbeat_seconds) as lost:
+            error = None
+            try:
+                handler(filename)
+            except Exception as e:
+                error = e
+            try:
+                if error is not None:
+                    print(f"Ошибка задания {filename} (попытка {job['attempts']}): {error}")
+                    queue.fail(job, worker_id, str(error))
+                    status = "error"
+                # Если аренду перехватили и миссию пишут оба воркера, MissionWriter пропустит
+                # вклад второй записи (logic.contribution), так что таблицы не задвоятся.
+                elif queue.complete(filename, worker_id):
+                    status = "ok"
+                    done += 1
+                else:
+                    status = "lost"
+            except PyMongoError as e:
+                # Задание останется running и вернется в очередь, когда истечет аренда.
+                print(f"Не удалось отметить задание {filename}: {e}")
+                REGISTRY.inc("job_queue_errors_total")
+                status = "queue_error"
+        if lost.is_set():
+            status = "lost"
+            print(f"Аренду задания {filename} перехватил другой воркер")
+
+        REGISTRY.inc("jobs_total", status=status)
+        log_event(
+            METRICS_LOG_FILE, "job", file=filename, worker=worker_id, status=status,
+            attempt=job["attempts"], seconds=round(time.perf_counter() - started, 6),
+        )
+        export_metrics()
+
+
+def enqueue_new_ocaps(queue: JobQueue | None = None) -> int:
+    """Ставит в очередь новые операции с сервера. Повторы упавших файлов дальше ведет сама очередь."""
+    queue = queue or JobQueue()
+    state = SyncState.load()
+    added = queue.enqueue(list_new_filenames(state))
+    state.set_pending([])
+    state.save()
+    return added
+
+
+def _run_local_worker(drain: bool) -> None:
+    run_worker(poll_seconds=None if drain else JOB_POLL_SECONDS)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Очередь обработки OCAP в Mongo")
+    parser.add_argument("command", choices=["enqueue", "worker", "status", "retry"])
+    parser.add_argument("--every", type=float, help="enqueue: повторять каждые N секунд")
+    parser.add_argument("--processes", type=int, default=1, help="worker: число процессов-воркеров на этой машине")
+    parser.add_argument("--drain", action="store_true", help="worker: завершиться, когда очередь опустеет")
+    args = parser.parse_args(argv)
+
+    job_queue = JobQueue()
+    job_queue.ensure_indexes()
+
+    if args.command == "enqueue":
+        while True:
+            try:
+                print(f"Поставлено в очередь: {enqueue_new_ocaps(job_queue)}")
+            except Exception as e:
+                if args.every is None:
+                    raise
+                print(f"Ошибка: {e}")
+            if args.every is None:
+                break
+            time.sleep(args.every)
+    elif args.command == "worker":
+        OCAPS_PATH.mkdir(exist_ok=True)
+        # Уникальный индекс по file нужен, чтобы параллельная запись одной миссии не прошла дважды.
+        ensure_indexes()
+        if args.processes == 1:
+            _run_local_worker(args.drain)
+        else:
+            # spawn, а не fork: у каждого процесса свой MongoClient.
+            context = multiprocessing.get_context("spawn")
+            workers = [context.Process(target=_run_local_worker, args=(args.drain,)) for _ in range(args.processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+    elif args.command == "retry":
+        print(f"Возвращено в очередь: {job_queue.retry_failed()}")
+    else:
+        for job_status, job_count in job_queue.stats().items():
+            print(f"{job_status}: {job_count}")
+
+
+if __name__ == "__main__":
+    main()
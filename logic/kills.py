@@ -0,0 +1,93 @@
+import argparse
+import json
+
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+from config import *
+
+# Поле документа миссии, в котором убийства идут от разбора до MissionWriter. В коллекцию миссий оно не пишется.
+KILLS_FIELD = "kills"
+
+KILL_INDEXES = [
+    ([("file", ASCENDING), ("frame", ASCENDING)], {}),
+    ([("weapon", ASCENDING), ("game_type", ASCENDING), ("file_date", ASCENDING)], {}),
+    ([("killer", ASCENDING), ("file_date", ASCENDING)], {}),
+    ([("world", ASCENDING), ("weapon", ASCENDING)], {}),
+]
+
+
+def kill_documents(data: dict, kills: list[dict]) -> list[dict]:
+    """Документы коллекции убийств: к каждому убийству добавляется срез миссии, по которому его ищут."""
+    mission = {
+        "file": data["file"],
+        "file_date": data.get("file_date"),
+        "game_type": data.get("game_type"),
+        "world": data.get("worldName"),
+    }
+    return [{**mission, **kill} for kill in kills]
+
+
+def store_kills(kills: dict[str, list[dict]], coll: Collection = kills_collection) -> None:
+    """
+    Заменяет убийства миссий: file -> документы. Прежние документы миссии удаляются целиком,
+    так что перезапись миссии не дублирует ее убийства, даже если их стало меньше.
+    MissionWriter вызывает ее до записи документа миссии: если запись прервется между удалением
+    и вставкой, миссия не будет считаться обработанной и при повторе убийства запишутся заново.
+    """
+    if not kills:
+        return
+    coll.delete_many({"file": {"$in": list(kills)}})
+    docs = [doc for mission_kills in kills.values() for doc in mission_kills]
+    if docs:
+        coll.insert_many(docs, ordered=False)
+
+
+def get_kills(file: str, coll: Collection = kills_collection) -> list[dict]:
+    return list(coll.find({"file": file}, {"_id": 0}).sort("frame", ASCENDING))
+
+
+def weapon_kills(
+        world: str | None = None,
+        game_type: str | None = None,
+        limit: int = 20,
+        coll: Collection = kills_collection,
+) -> list[dict]:
+    """Оружие по числу убийств игроков противника, со средней дистанцией. Без фильтров - по всем миссиям."""
+    match = {"kill_type": {"$ne": "tk"}, "veh_type": None}
+    if world:
+        match["world"] = world
+    if game_type:
+        match["game_type"] = game_type
+    return list(coll.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$weapon", "kills": {"$sum": 1}, "distance": {"$avg": "$distance"}}},
+        {"$sort": {"kills": -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "weapon": "$_id", "kills": 1, "distance": 1}},
+    ]))
+
+
+def ensure_kill_indexes(coll: Collection = kills_collection) -> None:
+    for keys, options in KILL_INDEXES:
+        coll.create_index(keys, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Убийства из коллекции kills")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    mission = commands.add_parser("mission", help="Убийства одной миссии по порядку кадров")
+    mission.add_argument("file")
+
+    weapons = commands.add_parser("weapons", help="Оружие по числу убийств")
+    weapons.add_argument("--world")
+    weapons.add_argument("--game-type")
+    weapons.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "mission":
+        result = get_kills(args.file)
+    else:
+        result = weapon_kills(args.world, args.game_type, args.limit)
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
@@ -0,0 +1,196 @@
+import argparse
+from collections import defaultdict
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.collection import Collection
+
+from config import *
+from logic.contribution import applied_versions
+
+PLAYER = "player"
+SQUAD = "squad"
+
+PLAYER_COUNTERS = ("frags", "frags_inf", "frags_veh", "tk", "death", "destroyed_veh")
+SQUAD_COUNTERS = ("frags", "tk", "death")
+
+# Поля документа миссии, нужные для подсчета ее вклада в таблицы.
+ROLLUP_PROJECTION = {
+    "_id": 0,
+    "file": 1,
+    "file_date": 1,
+    "game_type": 1,
+    **{f"players.{f}": 1 for f in ("name", *PLAYER_COUNTERS)},
+    **{f"squads.{f}": 1 for f in ("squad_tag", *SQUAD_COUNTERS)},
+}
+
+LEADERBOARD_INDEXES = [
+    ([("kind", ASCENDING), ("key", ASCENDING), ("game_type", ASCENDING), ("month", ASCENDING)], {"unique": True}),
+    ([("kind", ASCENDING), ("game_type", ASCENDING), ("month", ASCENDING)], {}),
+]
+
+
+def mission_month(data: dict) -> str | None:
+    # file_date вида 2025_08_23 -> 2025-08
+    file_date = data.get("file_date")
+    if not file_date:
+        return None
+    return file_date[:7].replace("_", "-")
+
+
+def mission_rollup(data: dict) -> dict[tuple, dict[str, int]]:
+    """Вклад одной миссии в таблицы: (kind, key, game_type, month) -> счетчики."""
+    game_type, month = data.get("game_type"), mission_month(data)
+    rollup: dict[tuple, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for player in data.get("players", []):
+        if not player.get("name"):
+            continue
+        counters = rollup[(PLAYER, player["name"], game_type, month)]
+        counters["missions"] += 1
+        for field in PLAYER_COUNTERS:
+            counters[field] += player.get(field, 0)
+    for squad in data.get("squads", []):
+        counters = rollup[(SQUAD, squad["squad_tag"], game_type, month)]
+        counters["missions"] += 1
+        for field in SQUAD_COUNTERS:
+            counters[field] += squad.get(field, 0)
+    return rollup
+
+
+def rollup_updates(added: list[dict], removed: list[dict] = ()) -> list[UpdateOne]:
+    """
+    $inc-обновления таблиц для пачки миссий. Вклад removed вычитается -
+    так перезапись миссии заменяет ее прежние цифры, а не добавляет их второй раз.
+    """
+    total: dict[tuple, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for sign, missions in ((1, added), (-1, removed)):
+        for data in missions:
+            for slice_key, counters in mission_rollup(data).items():
+                for field, value in counters.items():
+                    total[slice_key][field] += sign * value
+
+    updates = []
+    for (kind, key, game_type, month), counters in total.items():
+        counters = {field: value for field, value in counters.items() if value}
+        if not counters:
+            continue
+        updates.append(UpdateOne(
+            {"kind": kind, "key": key, "game_type": game_type, "month": month},
+            {"$inc": counters},
+            upsert=True,
+        ))
+    return updates
+
+
+def apply_rollup(
+        added: list[dict],
+        removed: list[dict] = (),
+        coll: Collection = leaderboard_collection,
+) -> None:
+    updates = rollup_updates(added, removed)
+    if updates:
+        coll.bulk_write(updates, ordered=False)
+
+
+def get_leaderboard(
+        kind: str = PLAYER,
+        game_type: str | None = None,
+        month: str | None = None,
+        limit: int | None = None,
+        coll: Collection = leaderboard_collection,
+) -> list[dict]:
+    """Таблица игроков или отрядов, при необходимости в разрезе типа игры и месяца. K/D считается при чтении."""
+    match = {"kind": kind}
+    if game_type is not None:
+        match["game_type"] = game_type
+    if month is not None:
+        match["month"] = month
+
+    counters = PLAYER_COUNTERS if kind == PLAYER else SQUAD_COUNTERS
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$key", "missions": {"$sum": "$missions"}, **{f: {"$sum": f"${f}"} for f in counters}}},
+        {"$addFields": {"kd": {"$divide": ["$frags", {"$max": ["$death", 1]}]}}},
+        {"$sort": {"frags": DESCENDING, "_id": ASCENDING}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return [{"key": row.pop("_id"), **row} for row in coll.aggregate(pipeline)]
+
+
+def compute_leaderboards(missions_coll: Collection = collection) -> dict[tuple, dict[str, int]]:
+    """Таблицы, посчитанные заново по всем миссиям, в памяти."""
+    total: dict[tuple, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for data in applied_versions(missions_coll, ROLLUP_PROJECTION):
+        for slice_key, counters in mission_rollup(data).items():
+            for field, value in counters.items():
+                total[slice_key][field] += value
+    return total
+
+
+def check_leaderboards(
+        missions_coll: Collection = collection,
+        coll: Collection = leaderboard_collection,
+) -> list[tuple]:
+    """Сравнивает сохраненные таблицы с пересчетом по миссиям. Возвращает расходящиеся срезы."""
+    expected = compute_leaderboards(missions_coll)
+    stored = {
+        (doc["kind"], doc["key"], doc["game_type"], doc["month"]): doc
+        for doc in coll.find({}, {"_id": 0})
+    }
+    mismatches = []
+    for slice_key in expected.keys() | stored.keys():
+        want = expected.get(slice_key, {})
+        have = stored.get(slice_key, {})
+        fields = set(want) | set(have) - {"kind", "key", "game_type", "month"}
+        if any(want.get(f, 0) != have.get(f, 0) for f in fields):
+            mismatches.append(slice_key)
+    return mismatches
+
+
+def rebuild_leaderboards(
+        missions_coll: Collection = collection,
+        coll: Collection = leaderboard_collection,
+        batch_size: int = 1000,
+) -> int:
+    """Полный пересчет таблиц по коллекции миссий. Возвращает число записанных срезов."""
+    total = compute_leaderboards(missions_coll)
+    coll.delete_many({})
+    docs = [
+        {"kind": kind, "key": key, "game_type": game_type, "month": month, **counters}
+        for (kind, key, game_type, month), counters in total.items()
+    ]
+    for i in range(0, len(docs), batch_size):
+        coll.insert_many(docs[i:i + batch_size], ordered=False)
+    return len(docs)
+
+
+def ensure_leaderboard_indexes(coll: Collection = leaderboard_collection) -> None:
+    for keys, options in LEADERBOARD_INDEXES:
+        coll.create_index(keys, **options)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Таблицы игроков и отрядов")
+    parser.add_argument("command", nargs="?", choices=["top", "rebuild", "check"], default="top")
+    parser.add_argument("--kind", choices=[PLAYER, SQUAD], default=PLAYER, help="top: игроки или отряды")
+    parser.add_argument("--game-type", help="top: ltvt, tvt1, tvt2, if, unknown")
+    parser.add_argument("--month", help="top: месяц, YYYY-MM")
+    parser.add_argument("--limit", type=int, default=20, help="top: число строк")
+    args = parser.parse_args(argv)
+
+    if args.command == "top":
+        columns = ("missions", *(PLAYER_COUNTERS if args.kind == PLAYER else SQUAD_COUNTERS))
+        print(f"{'':<24}" + "".join(f"{c:>14}" for c in columns) + f"{'kd':>8}")
+        for row in get_leaderboard(args.kind, args.game_type, args.month, args.limit):
+            print(f"{row['key'][:24]:<24}" + "".join(f"{row[c]:>14}" for c in columns) + f"{row['kd']:>8.2f}")
+    elif args.command == "rebuild":
+        print(f"Пересчитано срезов: {rebuild_leaderboards()}")
+    else:
+        mismatches = check_leaderboards()
+        for slice_key in mismatches:
+            print(f"Расхождение: {slice_key}")
+        print("Таблицы согласованы." if not mismatches else f"Расхождений: {len(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
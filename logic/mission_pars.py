@@ -1,36 +1,182 @@
+import argparse
 import os
-import json
 import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pymongo import MongoClient
+from typing import Iterator
 
+from pymongo.errors import PyMongoError
+
+from module.metrics import REGISTRY, MissionTrace, count, record_mission, stage
+from module.ocap_cache import OcapCache
 from module.ocap_models import OCAP
-from logic.name_logic import extract_name_and_squad
+from module.track_spill import MemoryGuard
+from logic.heatmaps import HEATMAP_FIELD, mission_heatmap
+from logic.kills import KILLS_FIELD, kill_documents
+from logic.contribution import PENDING_FIELD
+from logic.timeline import TIMELINE_FIELD, timeline_document
+from logic.name_logic import SquadResolver, get_squad_resolver
+from logic.storage import MissionWriter
 from config import *
 
-OCAPS_PATH.mkdir(exist_ok=True)
-TEMP_PATH.mkdir(exist_ok=True)
-
 def load_squads() -> dict:
-    if SQUAD_FILE.exists():
-        with SQUAD_FILE.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    return get_squad_resolver().roster()
+
+def get_ocap_cache() -> OcapCache | None:
+    if not OCAP_CACHE_ENABLED:
+        return None
+    return OcapCache(OCAP_CACHE_PATH, OCAP_CACHE_MAX_BYTES)
+
+
+def is_processed(ocap_file: Path) -> bool:
+    return collection.find_one({"file": ocap_file.name, PENDING_FIELD: {"$ne": True}}) is not None
+
+
+def processed_files(names: list[str]) -> set[str]:
+    """
+    Какие из файлов уже есть в базе - одним запросом вместо find_one на каждый файл.
+    Документ, чей вклад в таблицы еще не учтен (запись прервалась), обработанным не считается.
+    """
+    if not names:
+        return set()
+    return set(collection.distinct("file", {"file": {"$in": names}, PENDING_FIELD: {"$ne": True}}))
+
 
 def process_ocap(ocap_file: Path):
-    if collection.find_one({"file": ocap_file.name}):
+    if is_processed(ocap_file):
         print(f"Файл {ocap_file.name} уже обработан, пропускаю.")
         return
 
-    with ocap_file.open("r", encoding="utf-8") as f:
-        raw_data = json.load(f)
+    data, trace = build_mission_traced(ocap_file)
+    record_mission(trace, METRICS_LOG_FILE)
+    if isinstance(data, Exception):
+        raise data
+    with MissionWriter() as writer:
+        writer.add(data)
+    clear_temp()
+
+
+def process_ocaps(ocap_files: list[Path], workers: int = PROCESS_WORKERS) -> list[Path]:
+    """
+    Обработка пачки миссий. При workers > 1 разбор и подсчет статистики идут в пуле процессов,
+    а запись в Mongo - в текущем процессе в исходном порядке файлов.
+    Ошибка в одном файле не прерывает обработку остальных, ошибка записи пачки - следующих пачек.
+    Возвращает файлы, которые обработать или записать не удалось.
+    """
+    with stage("processed_check"):
+        done = processed_files([ocap_file.name for ocap_file in ocap_files])
+    pending, failed = [], []
+    for ocap_file in ocap_files:
+        if ocap_file.name in done:
+            print(f"Файл {ocap_file.name} уже обработан, пропускаю.")
+        else:
+            pending.append(ocap_file)
+
+    writer = MissionWriter()
+    by_name = {ocap_file.name: ocap_file for ocap_file in pending}
+
+    def write_failed(e: PyMongoError) -> None:
+        # Незаписанные миссии не считаются обработанными, их запишет следующий запуск.
+        print(f"Ошибка записи в Mongo: {e}")
+        failed.extend(by_name[file] for file in writer.discard())
+
+    for ocap_file, result in build_missions(pending, workers):
+        print(f"Обрабатываем: {ocap_file.name}")
+        if isinstance(result, Exception):
+            print(f"Ошибка обработки {ocap_file.name}: {result}")
+            failed.append(ocap_file)
+            continue
+        try:
+            writer.add(result)
+        except PyMongoError as e:
+            write_failed(e)
+    try:
+        writer.flush()
+    except PyMongoError as e:
+        write_failed(e)
+
+    clear_temp()
+    return failed
+
+
+def build_missions(ocap_files: list[Path], workers: int) -> Iterator[tuple[Path, dict | Exception]]:
+    """
+    Документы миссий (или ошибка разбора) в порядке ocap_files, при workers > 1 - из пула процессов.
+    Замеры каждой миссии учитываются в метриках текущего процесса.
+    """
+    if workers <= 1 or len(ocap_files) <= 1:
+        for ocap_file in ocap_files:
+            result, trace = build_mission_traced(ocap_file)
+            record_mission(trace, METRICS_LOG_FILE)
+            yield ocap_file, result
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ocap_files))) as executor:
+        futures = [executor.submit(build_mission_traced, ocap_file) for ocap_file in ocap_files]
+        # Результаты забираются в порядке файлов, а не готовности, чтобы запись была детерминированной.
+        for ocap_file, future in zip(ocap_files, futures):
+            try:
+                result, trace = future.result()
+            except Exception as e:
+                # Процесс пула упал целиком, замеров миссии нет.
+                REGISTRY.inc("missions_total", 1, status="error")
+                yield ocap_file, e
+                continue
+            record_mission(trace, METRICS_LOG_FILE)
+            yield ocap_file, result
+
+
+def build_mission_traced(ocap_file: Path) -> tuple[dict | Exception, MissionTrace]:
+    """build_mission_stats под замером. Ошибка разбора возвращается, а не выбрасывается, вместе с замерами."""
+    profile_path = PROFILE_PATH / f"{ocap_file.stem}.prof" if ocap_file.name == PROFILE_OCAP else None
+    trace = MissionTrace(ocap_file, trace_memory=METRICS_TRACE_MEMORY, profile_path=profile_path)
+    try:
+        with trace:
+            result = build_mission_stats(ocap_file)
+    except Exception as e:
+        result = e
+    return result, trace
 
-    squads_data = load_squads()
-    ocap = OCAP.from_file(ocap_file)
 
+def build_mission_stats(ocap_file: Path, use_cache: bool = True, trusted: bool = OCAP_TRUSTED_INPUT) -> dict:
+    """Разбор OCAP и подсчет статистики миссии без обращения к Mongo. Можно запускать в отдельном процессе."""
+    with stage("parse"):
+        ocap = OCAP.from_file(
+            ocap_file,
+            cache=get_ocap_cache() if use_cache else None,
+            trusted=trusted,
+            memory=MemoryGuard(OCAP_MEMORY_BUDGET, TEMP_PATH) if OCAP_MEMORY_BUDGET else None,
+            parse_workers=PARSE_WORKERS,
+        )
+
+    resolver = get_squad_resolver()
+    before = resolver.stats()
+    with stage("stats"):
+        data = mission_document(ocap, ocap_file, resolver)
+    if HEATMAPS_ENABLED:
+        with stage("heatmap"):
+            data[HEATMAP_FIELD] = mission_heatmap(ocap, data)
+    if TIMELINES_ENABLED:
+        with stage("timeline"):
+            data[TIMELINE_FIELD] = timeline_document(ocap, data)
+    after = resolver.stats()
+    count(
+        nickname_cache_hits=after["hits"] - before["hits"],
+        nickname_cache_misses=after["misses"] - before["misses"],
+    )
+    return data
+
+
+def mission_document(ocap: OCAP, ocap_file: Path, resolver: SquadResolver) -> dict:
+    """
+    Документ миссии для Mongo: статистика игроков и отрядов по разобранному OCAP.
+    Сами убийства идут в поле KILLS_FIELD для коллекции kills, в документе остаются счетчики.
+    """
+    squads_data = resolver.roster()
+    players = list(ocap.players.values())
     players_stats: dict[int, dict] = {}
-    for p in ocap.players.values():
-        clean_name, squad = extract_name_and_squad(p.name)
+    for p, (clean_name, squad) in zip(players, resolver.resolve_many(p.name for p in players)):
         players_stats[p.id] = {
             "id": p.id,
             "name": clean_name,
@@ -41,11 +187,12 @@ def process_ocap(ocap_file: Path):
             "frags_inf": 0,
             "tk": 0,
             "death": 0,
-            "victims_players": [],
-            "destroyed_vehicles": [],
             "destroyed_veh": 0
         }
+        if MISSION_EMBED_KILLS:
+            players_stats[p.id] |= {"victims_players": [], "destroyed_vehicles": []}
 
+    kills = []
     for e in ocap.events:
         killed = getattr(e, "killed", None)
         killer = getattr(e, "killer", None)
@@ -61,13 +208,15 @@ def process_ocap(ocap_file: Path):
         if is_killed_vehicle:
             kill_type = "veh"
             killer_stats["destroyed_veh"] += 1
-            killer_stats["destroyed_vehicles"].append({
-                "name": getattr(killed, "name", "unknown"),
-                "veh_type": str(getattr(killed, "vehicle_type", "unknown")),
-                "weapon": weapon_name,
-                "distance": distance,
-                "kill_type": kill_type
-            })
+            if MISSION_EMBED_KILLS:
+                killer_stats["destroyed_vehicles"].append({
+                    "name": getattr(killed, "name", "unknown"),
+                    "veh_type": str(getattr(killed, "vehicle_type", "unknown")),
+                    "weapon": weapon_name,
+                    "distance": distance,
+                    "kill_type": kill_type
+                })
+            victim, victim_squad, victim_side = getattr(killed, "name", "unknown"), None, None
         else:
             same_side = hasattr(killed, "side") and killer.side == getattr(killed, "side", None)
             if same_side:
@@ -81,13 +230,37 @@ def process_ocap(ocap_file: Path):
                     kill_type = "kill"
                     killer_stats["frags_inf"] += 1
 
-            killer_stats["victims_players"].append({
-                "name": getattr(killed, "name", "unknown"),
-                "weapon": weapon_name,
-                "distance": distance,
-                "killer_name": killer_stats["name"],
-                "kill_type": kill_type
-            })
+            if MISSION_EMBED_KILLS:
+                killer_stats["victims_players"].append({
+                    "name": getattr(killed, "name", "unknown"),
+                    "weapon": weapon_name,
+                    "distance": distance,
+                    "killer_name": killer_stats["name"],
+                    "kill_type": kill_type
+                })
+            victim_side = getattr(killed, "side", None)
+            # Жертва записывается так же, как убийца: очищенный ник и отряд.
+            if getattr(killed, "id", None) in players_stats:
+                victim, victim_squad = players_stats[killed.id]["name"], players_stats[killed.id]["squad"]
+            else:
+                victim, victim_squad = resolver.resolve(getattr(killed, "name", "unknown"))
+                victim_squad = victim_squad or None
+
+        kill = {
+            "frame": getattr(e, "frame", None),
+            "killer": killer_stats["name"],
+            "killer_squad": killer_stats["squad"],
+            "side": killer.side,
+            "victim": victim,
+            "victim_squad": victim_squad,
+            "victim_side": victim_side,
+            "weapon": weapon_name,
+            "distance": distance,
+            "kill_type": kill_type,
+        }
+        if is_killed_vehicle:
+            kill["veh_type"] = str(getattr(killed, "vehicle_type", "unknown"))
+        kills.append(kill)
 
         if not is_killed_vehicle and hasattr(killed, "id") and killed.id in players_stats:
             players_stats[killed.id]["death"] += 1
@@ -95,20 +268,11 @@ def process_ocap(ocap_file: Path):
     for stats in players_stats.values():
         stats["frags"] = stats["frags_inf"] + stats["frags_veh"] - stats["tk"]
 
-    win_side = None
-    for event in raw_data.get("events", []):
-        if isinstance(event, list) and len(event) >= 2 and event[1] == "endMission":
-            win_side = event[2][0] if len(event) > 2 and isinstance(event[2], list) else None
-            break
+    win_side = ocap.win_side
+    mission_name = ocap.mission_name
+    world_name = ocap.world_name
 
-    mission_name = raw_data.get("missionName", "Unknown Mission")
-    world_name = raw_data.get("worldName", "Unknown World")
-
-    file_date = None
-    if "__" in ocap_file.stem:
-        file_date = ocap_file.stem.split("__")[0]
-    else:
-        file_date = "_".join(ocap_file.stem.split("_")[0:3])
+    file_date = get_file_date(ocap_file)
 
     squads_stats: dict[str, dict] = {}
     for player in players_stats.values():
@@ -123,16 +287,17 @@ def process_ocap(ocap_file: Path):
                 "frags": 0,
                 "death": 0,
                 "tk": 0,
-                "victims_players": [],
                 "squad_players": []
             }
+            if MISSION_EMBED_KILLS:
+                squads_stats[squad_tag]["victims_players"] = []
 
         s = squads_stats[squad_tag]
         s["frags"] += player["frags"]
         s["death"] += player["death"]
         s["tk"] += player["tk"]
 
-        for v in player["victims_players"]:
+        for v in player.get("victims_players", []):
             s["victims_players"].append({
                 "name": v["name"],
                 "weapon": v["weapon"],
@@ -157,11 +322,47 @@ def process_ocap(ocap_file: Path):
         "players": list(players_stats.values()),
         "squads": list(squads_stats.values())
     }
+    data[KILLS_FIELD] = kill_documents(data, kills)
+    return data
 
-    collection.insert_one(data)
 
+def export_metrics() -> None:
+    """Сохраняет накопленные метрики процесса в METRICS_FILE."""
+    if METRICS_FILE is not None:
+        REGISTRY.write_prometheus(METRICS_FILE)
+
+
+def get_file_date(ocap_file: Path) -> str:
+    # 2025_08_23__21_10_... -> 2025_08_23
+    if "__" in ocap_file.stem:
+        return ocap_file.stem.split("__")[0]
+    return "_".join(ocap_file.stem.split("_")[0:3])
+
+
+def clear_temp() -> None:
+    if not TEMP_PATH.exists():
+        return
     for item in TEMP_PATH.iterdir():
         if item.is_file():
             item.unlink()
         elif item.is_dir():
             shutil.rmtree(item)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Обработка указанных файлов OCAP; уже обработанные пропускаются")
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--workers", type=int, default=PROCESS_WORKERS)
+    args = parser.parse_args(argv)
+
+    try:
+        failed = process_ocaps(args.files, args.workers)
+    finally:
+        export_metrics()
+    if failed:
+        print(f"Не удалось обработать: {', '.join(f.name for f in failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
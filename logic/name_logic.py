@@ -1,7 +1,16 @@
+import json
 import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+from config import *
+
+SQUAD_TAG_RE = re.compile(r"\[(.*?)\]")
+
 
 def extract_name_and_squad(nickname: str) -> tuple[str, str]:
-    match = re.search(r"\[(.*?)\]", nickname)
+    match = SQUAD_TAG_RE.search(nickname)
     if match:
         squad = match.group(1).upper()
     else:
@@ -14,10 +23,76 @@ def extract_name_and_squad(nickname: str) -> tuple[str, str]:
             if len(parts) > 1:
                 squad = parts[0].upper()
 
-    nickname_clean = re.sub(r"\[.*?\]", " ", nickname)
+    nickname_clean = SQUAD_TAG_RE.sub(" ", nickname)
     nickname_clean = nickname_clean.replace(".", " ")
     parts = nickname_clean.split()
 
     name = parts[-1].lower() if parts else ""
 
-    return name, squad
\ No newline at end of file
+    return name, squad
+
+
+class SquadResolver:
+    """
+    Ростер отрядов и разбор ников для обработки миссий.
+    Ростер читается из squad_file один раз и перечитывается только при смене mtime или размера файла.
+    Разбор ника в (имя, отряд) запоминается в LRU на maxsize ников - из недели в неделю играют одни и те же люди.
+    """
+
+    def __init__(self, squad_file: Path = SQUAD_FILE, maxsize: int = NICKNAME_CACHE_SIZE):
+        self.squad_file = squad_file
+        self.roster_reloads = 0
+        self._roster: dict = {}
+        self._roster_signature: tuple[int, int] | None = None
+        self._resolve = lru_cache(maxsize=maxsize)(extract_name_and_squad)
+
+    def roster(self) -> dict:
+        try:
+            stat = self.squad_file.stat()
+        except FileNotFoundError:
+            self._roster, self._roster_signature = {}, None
+            return self._roster
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._roster_signature:
+            with self.squad_file.open("r", encoding="utf-8") as f:
+                self._roster = json.load(f)
+            self._roster_signature = signature
+            self.roster_reloads += 1
+        return self._roster
+
+    def resolve(self, nickname: str) -> tuple[str, str]:
+        return self._resolve(nickname)
+
+    def resolve_many(self, nicknames: Iterable[str]) -> list[tuple[str, str]]:
+        """Разбор всех ников миссии разом: повторяющиеся ники разбираются и учитываются в статистике один раз."""
+        nicknames = list(nicknames)
+        resolved = {nickname: self._resolve(nickname) for nickname in dict.fromkeys(nicknames)}
+        return [resolved[nickname] for nickname in nicknames]
+
+    def stats(self) -> dict:
+        info = self._resolve.cache_info()
+        total = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": info.hits / total if total else 0.0,
+            "roster_reloads": self.roster_reloads,
+        }
+
+    def clear(self) -> None:
+        self._resolve.cache_clear()
+        self._roster, self._roster_signature = {}, None
+
+
+_resolver: SquadResolver | None = None
+
+
+def get_squad_resolver() -> SquadResolver:
+    """Общий для процесса резолвер: у каждого процесса пула свой кэш."""
+    global _resolver
+    if _resolver is None:
+        _resolver = SquadResolver()
+    return _resolver
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import httpx
+
+from config import *
+from module.metrics import REGISTRY, count, log_event
+from module.ocap_archive import compressing_writer
+
+# Права скачанного файла. umask не читаем: os.umask меняет его для всего процесса, в том числе для других потоков.
+OCAP_FILE_MODE = 0o644
+
+
+class TokenBucket:
+    """Ограничение частоты запросов: rate токенов в секунду, не более capacity подряд."""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def download_ocap(
+        client: httpx.AsyncClient,
+        filename: str,
+        bucket: TokenBucket,
+        ocap_url: str = OCAP_URL,
+        target_dir: Path = OCAPS_PATH,
+) -> Path:
+    """
+    Скачивает один OCAP потоком во временный .part файл рядом с целевым и атомарно переименовывает.
+    Недокачанный файл никогда не лежит под своим настоящим именем.
+    При заданном OCAP_ARCHIVE_COMPRESSION файл сжимается на лету и сохраняется под тем же именем.
+    """
+    await bucket.acquire()
+    started = time.perf_counter()
+    filepath = target_dir / filename
+    fd, part_name = tempfile.mkstemp(dir=target_dir, prefix=f".{filename}.", suffix=".part")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as part:
+            with compressing_writer(part, OCAP_ARCHIVE_COMPRESSION, OCAP_ARCHIVE_LEVEL) as writer:
+                async with client.stream("GET", ocap_url % filename) as r:
+                    r.raise_for_status()
+                    # aiter_bytes отдает уже распакованные gzip/deflate данные.
+                    async for chunk in r.aiter_bytes():
+                        writer.write(chunk)
+                        size += len(chunk)
+            part.flush()
+            os.fsync(part.fileno())
+        # mkstemp создает файл с правами 0600, выставляем обычные.
+        os.chmod(part_name, OCAP_FILE_MODE)
+        os.replace(part_name, filepath)
+    except BaseException:
+        Path(part_name).unlink(missing_ok=True)
+        raise
+
+    count(download_bytes=size)
+    log_event(METRICS_LOG_FILE, "download", file=filename, bytes=size, seconds=round(time.perf_counter() - started, 6))
+    return filepath
+
+
+async def download_ocaps(
+        filenames: list[str],
+        ocap_url: str = OCAP_URL,
+        target_dir: Path = OCAPS_PATH,
+        concurrency: int = DOWNLOAD_CONCURRENCY,
+        rate: float = DOWNLOAD_RATE,
+        on_done: Callable[[Path], None] | None = None,
+) -> list[Path]:
+    """
+    Параллельная загрузка списка файлов через общий пул соединений.
+    Возвращает пути успешно скачанных файлов в порядке filenames, ошибки печатаются и пропускаются.
+    on_done вызывается в отдельном потоке с каждым файлом сразу после его загрузки; пока он не вернул
+    управление, слот загрузки занят - так обработка может придерживать загрузку.
+    """
+    target_dir.mkdir(exist_ok=True)
+    bucket = TokenBucket(rate, capacity=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Accept-Encoding": "gzip, deflate"}
+
+    async with httpx.AsyncClient(limits=limits, headers=headers, timeout=DOWNLOAD_TIMEOUT) as client:
+        async def fetch(filename: str) -> Path:
+            async with semaphore:
+                print(f"Скачиваем: {filename}")
+                path = await download_ocap(client, filename, bucket, ocap_url, target_dir)
+                if on_done is not None:
+                    await asyncio.to_thread(on_done, path)
+                return path
+
+        results = await asyncio.gather(*(fetch(f) for f in filenames), return_exceptions=True)
+
+    downloaded = []
+    for filename, result in zip(filenames, results):
+        if isinstance(result, BaseException):
+            print(f"Ошибка скачивания {filename}: {result!r}")
+            REGISTRY.inc("downloads_total", status="error")
+            continue
+        REGISTRY.inc("downloads_total", status="ok")
+        downloaded.append(result)
+    return downloaded
+
+
+def download_ocaps_sync(filenames: list[str], **kwargs) -> list[Path]:
+    if not filenames:
+        return []
+    return asyncio.run(download_ocaps(filenames, **kwargs))
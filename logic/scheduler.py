@@ -0,0 +1,267 @@
+import argparse
+import os
+import queue
+import random
+import signal
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from config import *
+from logic.download_mission import list_new_filenames
+from logic.mission_pars import export_metrics, process_ocaps
+from logic.ocap_downloader import download_ocaps_sync
+from logic.storage import ensure_indexes
+from logic.sync_state import SyncState
+from module.metrics import REGISTRY, stage
+
+
+def is_game_night(
+        now: datetime,
+        hours: tuple[int, int] = SCHEDULER_GAME_NIGHT_HOURS,
+        days: tuple[int, ...] = SCHEDULER_GAME_NIGHT_DAYS,
+) -> bool:
+    """Идет ли игровой вечер по расписанию. Часы после полуночи относятся к вечеру накануне."""
+    start, end = hours
+    if end <= now.hour < start:
+        return False
+    evening = now if now.hour >= start else now - timedelta(days=1)
+    return evening.weekday() in days
+
+
+def next_delay(now: datetime, failures: int, rng: random.Random = random) -> float:
+    """
+    Пауза до следующего опроса сервера: в игровые вечера короче, после ошибок растет вдвое
+    до SCHEDULER_MAX_BACKOFF_SECONDS. Случайный разброс не дает нескольким экземплярам
+    и повторам после сбоя бить в сервер одновременно.
+    """
+    if failures:
+        delay = min(SCHEDULER_ERROR_SECONDS * 2 ** (failures - 1), SCHEDULER_MAX_BACKOFF_SECONDS)
+    elif is_game_night(now):
+        delay = SCHEDULER_GAME_NIGHT_SECONDS
+    else:
+        delay = SCHEDULER_IDLE_SECONDS
+    return delay * rng.uniform(1 - SCHEDULER_JITTER, 1 + SCHEDULER_JITTER)
+
+
+class WorkQueue:
+    """
+    Ограниченная очередь файлов между загрузкой и обработкой: put ждет, пока в очереди нет места.
+    Файл, который уже ждет или обрабатывается, второй раз не ставится.
+    """
+
+    def __init__(self, maxsize: int = SCHEDULER_QUEUE_SIZE):
+        self._queue: queue.Queue[Path | None] = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._queued: set[str] = set()
+        self._failed: set[str] = set()
+        self._closed = False
+
+    def put(self, ocap_file: Path) -> bool:
+        with self._lock:
+            if ocap_file.name in self._queued:
+                return False
+            self._queued.add(ocap_file.name)
+        self._queue.put(ocap_file)
+        REGISTRY.set("work_queue_size", self._queue.qsize())
+        return True
+
+    def get_batch(self, size: int) -> list[Path] | None:
+        """Ждет первый файл и добирает к нему уже готовые, всего не больше size. None - очередь закрыта."""
+        if self._closed:
+            return None
+        batch = []
+        item = self._queue.get()
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= size:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if item is None:
+            self._closed = True
+            self._queue.task_done()
+        return batch or None
+
+    def done(self, batch: list[Path], failed: list[Path]) -> None:
+        with self._lock:
+            self._queued.difference_update(p.name for p in batch)
+            self._failed.update(p.name for p in failed)
+        for _ in batch:
+            self._queue.task_done()
+        REGISTRY.set("work_queue_size", self._queue.qsize())
+
+    def take_failed(self, names: list[str]) -> set[str]:
+        with self._lock:
+            failed = self._failed.intersection(names)
+            self._failed.difference_update(failed)
+        return failed
+
+    def join(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+
+class DirectoryWatcher:
+    """
+    Слежение за каталогом опросом: файл отдается в обработку, когда его размер и mtime не изменились
+    между двумя проходами, то есть запись в него закончена. Скрытые файлы (.part загрузок) пропускаются.
+    Измененный файл отдается снова; уже обработанные миссии process_ocaps пропустит сам.
+    """
+
+    def __init__(self, path: Path = OCAPS_PATH):
+        self.path = path
+        self._seen: dict[str, tuple[int, int]] = {}
+        self._handled: dict[str, tuple[int, int]] = {}
+
+    def scan(self) -> list[Path]:
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        ready = [
+            name for name, signature in current.items()
+            if self._seen.get(name) == signature and self._handled.get(name) != signature
+        ]
+        for name in ready:
+            self._handled[name] = current[name]
+        self._seen = current
+        return [self.path / name for name in sorted(ready)]
+
+
+class Scheduler:
+    """
+    Загрузка и обработка миссий без фиксированного цикла: опрос сервера с переменной паузой (next_delay),
+    обработка в отдельном потоке из ограниченной очереди WorkQueue, пока идут загрузки,
+    при watch - еще и файлы, положенные в OCAPS_PATH вручную. SIGTERM/SIGINT останавливают опрос,
+    уже поставленные в очередь файлы дообрабатываются; повторный сигнал завершает процесс, не дожидаясь очереди.
+    """
+
+    def __init__(
+            self,
+            sync: bool = True,
+            watch: bool = SCHEDULER_WATCH,
+            workers: int = PROCESS_WORKERS,
+            batch_size: int = MONGO_BATCH_SIZE,
+    ):
+        self.sync = sync
+        self.watch = watch
+        self.workers = workers
+        self.batch_size = batch_size
+        self.work = WorkQueue()
+        self.stop = threading.Event()
+        self._aborted = False
+        self._indexes_ready = False
+
+    def _request_stop(self, signum: int, frame) -> None:
+        if self.stop.is_set():
+            self._aborted = True
+            raise SystemExit(1)
+        print(f"Получен сигнал {signal.Signals(signum).name}, дообрабатываю очередь и выхожу...")
+        self.stop.set()
+
+    def _process_loop(self) -> None:
+        while (batch := self.work.get_batch(self.batch_size)) is not None:
+            failed = batch
+            try:
+                failed = process_ocaps(batch, self.workers)
+            except Exception as e:
+                print(f"Ошибка обработки: {e}")
+            finally:
+                self.work.done(batch, failed)
+                export_metrics()
+
+    def _watch_loop(self) -> None:
+        watcher = DirectoryWatcher()
+        while not self.stop.wait(SCHEDULER_WATCH_SECONDS):
+            try:
+                for ocap_file in watcher.scan():
+                    self.work.put(ocap_file)
+            except OSError as e:
+                print(f"Ошибка чтения {OCAPS_PATH}: {e}")
+
+    def sync_once(self) -> None:
+        """Один проход синхронизации. Ждет обработки своих файлов, чтобы записать результат в SyncState."""
+        if not self._indexes_ready:
+            ensure_indexes()
+            self._indexes_ready = True
+
+        state = SyncState.load()
+        filenames = list_new_filenames(state)
+        if not filenames:
+            print("Новых миссий не найдено.")
+            state.save()
+            return
+
+        # Уже скачанные файлы обрабатываются, пока качаются остальные.
+        missing = []
+        for filename in filenames:
+            if (OCAPS_PATH / filename).exists():
+                self.work.put(OCAPS_PATH / filename)
+            else:
+                missing.append(filename)
+        with stage("download"):
+            download_ocaps_sync(missing, on_done=self.work.put)
+
+        self.work.join()
+        failed = self.work.take_failed(filenames)
+        state.set_pending([f for f in filenames if not (OCAPS_PATH / f).exists() or f in failed])
+        state.save()
+
+    def run(self) -> None:
+        OCAPS_PATH.mkdir(exist_ok=True)
+        TEMP_PATH.mkdir(exist_ok=True)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        # Потоки фоновые: после повторного сигнала процесс завершается, не дожидаясь их.
+        threads = [threading.Thread(target=self._process_loop, name="process", daemon=True)]
+        if self.watch:
+            threads.append(threading.Thread(target=self._watch_loop, name="watch", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        failures = 0
+        try:
+            while not self.stop.is_set():
+                if self.sync:
+                    try:
+                        self.sync_once()
+                        failures = 0
+                    except Exception as e:
+                        failures += 1
+                        REGISTRY.inc("sync_errors_total")
+                        print(f"Ошибка синхронизации ({failures} подряд): {e}")
+                delay = next_delay(datetime.now(), failures)
+                if self.sync:
+                    print(f"Следующий опрос через {delay:.0f} с")
+                self.stop.wait(delay)
+        finally:
+            self.stop.set()
+            if not self._aborted:
+                self.work.close()
+                threads[0].join()
+            export_metrics()
+            print("Остановлено.")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Загрузка и обработка миссий")
+    parser.add_argument("--watch", action="store_true", default=SCHEDULER_WATCH, help="Подхватывать файлы в OCAPS_PATH")
+    parser.add_argument("--no-sync", dest="sync", action="store_false", help="Не опрашивать сервер, только --watch")
+    args = parser.parse_args(argv)
+    if not args.sync and not args.watch:
+        parser.error("--no-sync имеет смысл только с --watch")
+    Scheduler(sync=args.sync, watch=args.watch).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import time
+from pathlib import Path
+
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, OperationFailure
+from pymongo.write_concern import WriteConcern
+
+from config import *
+from logic.heatmaps import HEATMAP_FIELD, ensure_heatmap_indexes, store_heatmaps
+from logic.kills import KILLS_FIELD, ensure_kill_indexes, store_kills
+from logic.contribution import claim_versions, release_versions, write_versions
+from logic.leaderboard import ROLLUP_PROJECTION, apply_rollup, ensure_leaderboard_indexes
+from logic.timeline import TIMELINE_FIELD, ensure_timeline_indexes, store_timelines
+from module.metrics import add_stage, count, log_event
+
+# Поля, которые идут в документе миссии от разбора до MissionWriter и пишутся в свои коллекции.
+SIDE_FIELDS = (HEATMAP_FIELD, TIMELINE_FIELD, KILLS_FIELD)
+
+MISSION_INDEXES = [
+    ("file", {"unique": True}),
+    ("file_date", {}),
+    ("game_type", {}),
+    ("players.name", {}),
+]
+
+
+def ensure_indexes(
+        coll: Collection = collection,
+        leaderboard_coll: Collection = leaderboard_collection,
+        heatmaps_coll: Collection = heatmaps_collection,
+        heatmap_missions_coll: Collection = heatmap_missions_collection,
+        timelines_coll: Collection = timelines_collection,
+        kills_coll: Collection = kills_collection,
+) -> None:
+    """Создает индексы коллекции миссий и коллекций, которые пишет MissionWriter. Повторный вызов ничего не меняет."""
+    for field, options in MISSION_INDEXES:
+        try:
+            coll.create_index([(field, ASCENDING)], **options)
+        except OperationFailure as e:
+            # Уникальный индекс не создастся, пока в коллекции есть дубли file.
+            print(f"Не удалось создать индекс {field}: {e}")
+    ensure_leaderboard_indexes(leaderboard_coll)
+    ensure_heatmap_indexes(heatmaps_coll, heatmap_missions_coll)
+    ensure_timeline_indexes(timelines_coll)
+    ensure_kill_indexes(kills_coll)
+
+
+class MissionWriter:
+    """
+    Буферизованная запись документов миссий. Документы копятся до batch_size и уходят одним bulk_write
+    как upsert по file, поэтому повторная запись той же миссии заменяет документ, а не дублирует его.
+    При rollup=True вместе с записью обновляются таблицы игроков и отрядов (logic.leaderboard):
+    вклад прежней версии документа вычитается, новой - прибавляется. Так же сводятся тепловые карты
+    (logic.heatmaps), если документ несет их в поле heatmap, а шкала миссии из поля timeline
+    пишется в свою коллекцию (logic.timeline), убийства из поля kills - в коллекцию kills (logic.kills).
+    """
+
+    def __init__(
+            self,
+            coll: Collection = collection,
+            batch_size: int = MONGO_BATCH_SIZE,
+            write_concern: dict = MONGO_WRITE_CONCERN,
+            rollup: bool = True,
+            leaderboard_coll: Collection = leaderboard_collection,
+            heatmaps_coll: Collection = heatmaps_collection,
+            heatmap_missions_coll: Collection = heatmap_missions_collection,
+            timelines_coll: Collection = timelines_collection,
+            kills_coll: Collection = kills_collection,
+            log_file: Path | None = METRICS_LOG_FILE,
+    ):
+        self.collection = coll.with_options(write_concern=WriteConcern(**write_concern))
+        self.batch_size = batch_size
+        self.rollup = rollup
+        self.leaderboard_collection = leaderboard_coll
+        self.heatmaps_collection = heatmaps_coll
+        self.heatmap_missions_collection = heatmap_missions_coll
+        self.timelines_collection = timelines_coll
+        self.kills_collection = kills_coll
+        self.log_file = log_file
+        self._buffer: list[dict] = []
+
+    def add(self, data: dict) -> None:
+        self._buffer.append(data)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Сводки миссий (тепловые карты, шкала, убийства) пишутся до документа миссии: они перезаписываются по file,
+        и повтор после сбоя их просто обновит. Документ миссии пишется новой версией с отметкой PENDING_FIELD
+        (logic.contribution): до снятия отметки processed_files не считает миссию обработанной, а вклад в таблицы
+        добавляет только тот, кто отметку снял, - так параллельная запись той же миссии не задваивает таблицы.
+        Если часть документов не записалась, таблицы обновляются для записанных, незаписанные остаются
+        в буфере, а BulkWriteError пробрасывается.
+        """
+        if not self._buffer:
+            return
+        # Если миссия попала в буфер дважды, остается последняя версия.
+        missions = list({data["file"]: data for data in self._buffer}.values())
+        heatmaps = [data[HEATMAP_FIELD] for data in missions if data.get(HEATMAP_FIELD)]
+        timelines = [data[TIMELINE_FIELD] for data in missions if data.get(TIMELINE_FIELD)]
+        kills = {data["file"]: data[KILLS_FIELD] for data in missions if KILLS_FIELD in data}
+        docs = [{k: v for k, v in data.items() if k not in SIDE_FIELDS} for data in missions]
+        started = time.perf_counter()
+
+        store_heatmaps(heatmaps, self.heatmaps_collection, self.heatmap_missions_collection)
+        store_timelines(timelines, self.timelines_collection)
+        store_kills(kills, self.kills_collection)
+
+        error, failed = None, set()
+        if self.rollup:
+            written, removed, error = write_versions(self.collection, docs, ROLLUP_PROJECTION)
+            failed = {doc["file"] for doc in docs} - {doc["file"] for doc in written}
+            claimed = claim_versions(self.collection, written)
+            previous = [removed[doc["file"]] for doc in claimed if doc["file"] in removed]
+            try:
+                apply_rollup(claimed, previous, self.leaderboard_collection)
+            except Exception:
+                release_versions(self.collection, claimed)
+                raise
+        else:
+            requests = [ReplaceOne({"file": doc["file"]}, doc, upsert=True) for doc in docs]
+            try:
+                self.collection.bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                error = e
+                failed = {docs[err["index"]]["file"] for err in e.details["writeErrors"]}
+            written = [doc for doc in docs if doc["file"] not in failed]
+        self._buffer = [data for data in missions if data["file"] in failed]
+
+        seconds = time.perf_counter() - started
+        add_stage("mongo_write", seconds)
+        count(mongo_docs=len(written))
+        log_event(self.log_file, "mongo_write", docs=len(written), seconds=round(seconds, 6))
+        if error:
+            raise error
+
+    def discard(self) -> list[str]:
+        """Убирает из буфера документы, оставшиеся после ошибки записи. Возвращает их file."""
+        files = list(dict.fromkeys(data["file"] for data in self._buffer))
+        self._buffer = []
+        return files
+
+    def __enter__(self) -> "MissionWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
@@ -0,0 +1,88 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from config import *
+
+
+class SyncState(BaseModel):
+    """
+    Состояние синхронизации с сервером OCAP, сохраняется между проходами.
+    seen - уже учтенные операции (файл -> дата) за последние SYNC_WINDOW_DAYS дней от самой новой,
+    так что операция, появившаяся в списке задним числом, все равно будет скачана.
+    last_date/last_filename - самая новая учтенная операция: прежний курсор, по нему работает только
+    первый проход после обновления, пока seen пуст. etag/last_modified - для условного запроса списка, pending - файлы, которые не удалось скачать
+    или обработать, attempts - сколько раз подряд это не удалось.
+    """
+    last_date: str | None = None
+    last_filename: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+    pending: list[str] = []
+    attempts: dict[str, int] = {}
+    seen: dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: Path = SYNC_STATE_FILE) -> "SyncState":
+        if path.exists():
+            return cls.model_validate_json(path.read_text(encoding="utf-8"))
+        return cls()
+
+    def save(self, path: Path = SYNC_STATE_FILE) -> None:
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.model_dump_json(indent=2), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    @property
+    def cursor(self) -> tuple[str, str] | None:
+        if self.last_date is None or self.last_filename is None:
+            return None
+        return self.last_date, self.last_filename
+
+    def window_start(self, window_days: int = SYNC_WINDOW_DAYS) -> str | None:
+        if self.last_date is None:
+            return None
+        start = datetime.strptime(self.last_date, "%Y-%m-%d") - timedelta(days=window_days)
+        return start.strftime("%Y-%m-%d")
+
+    def is_new(self, ocap: dict) -> bool:
+        if not self.seen:
+            cursor = self.cursor
+            return cursor is None or (ocap["date"], ocap["filename"]) > cursor
+        start = self.window_start()
+        if start is not None and ocap["date"] < start:
+            return False
+        return ocap["filename"] not in self.seen
+
+    def advance(self, ocaps: list[dict]) -> None:
+        """Отмечает операции списка учтенными и сдвигает окно. Передается весь список, а не только новые."""
+        if not ocaps:
+            return
+        for ocap in ocaps:
+            self.seen[ocap["filename"]] = ocap["date"]
+        newest = max(ocaps, key=lambda o: (o["date"], o["filename"]))
+        cursor = self.cursor
+        if cursor is None or (newest["date"], newest["filename"]) > cursor:
+            self.last_date, self.last_filename = newest["date"], newest["filename"]
+        start = self.window_start()
+        self.seen = {filename: date for filename, date in self.seen.items() if date >= start}
+
+    def set_pending(self, filenames: list[str], max_attempts: int = SYNC_MAX_ATTEMPTS) -> None:
+        attempts = {}
+        for filename in filenames:
+            attempts[filename] = self.attempts.get(filename, 0) + 1
+            if attempts[filename] >= max_attempts:
+                print(f"Файл {filename} не удалось обработать {max_attempts} раз, больше не повторяем.")
+                del attempts[filename]
+        self.pending = list(attempts)
+        self.attempts = attempts
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
@@ -0,0 +1,39 @@
+from typing import Any
+
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.collection import Collection
+
+from config import *
+from module.timeline import mission_timeline
+
+# Поле документа миссии, в котором шкала идет от разбора до MissionWriter. В коллекцию миссий оно не пишется.
+TIMELINE_FIELD = "timeline"
+
+TIMELINE_INDEXES = [
+    ([("file", ASCENDING)], {"unique": True}),
+    ([("file_date", ASCENDING)], {}),
+]
+
+
+def timeline_document(ocap: Any, data: dict) -> dict:
+    """Прореженная шкала миссии для дашбордов, хранится отдельно от документа миссии под тем же file."""
+    return {
+        "file": data["file"],
+        "file_date": data.get("file_date"),
+        "game_type": data.get("game_type"),
+        **mission_timeline(ocap, TIMELINE_STEP_FRAMES),
+    }
+
+
+def store_timelines(timelines: list[dict], coll: Collection = timelines_collection) -> None:
+    if timelines:
+        coll.bulk_write([ReplaceOne({"file": t["file"]}, t, upsert=True) for t in timelines], ordered=False)
+
+
+def get_timeline(file: str, coll: Collection = timelines_collection) -> dict | None:
+    return coll.find_one({"file": file}, {"_id": 0})
+
+
+def ensure_timeline_indexes(coll: Collection = timelines_collection) -> None:
+    for keys, options in TIMELINE_INDEXES:
+        coll.create_index(keys, **options)
@@ -1,11 +1,37 @@
-import time
-from logic.download_mission import main
+import argparse
+import importlib
+import sys
+
+# Модуль команды импортируется только при ее запуске: разбор OCAP (pydantic, numpy), загрузчик
+# и pymongo не грузятся ради команды, которой они не нужны. Аргументы команды разбирает ее модуль.
+COMMANDS = {
+    "sync": ("logic.scheduler", "Загрузка и обработка новых миссий (по умолчанию)"),
+    "process": ("logic.mission_pars", "Обработка указанных файлов OCAP"),
+    "backfill": ("logic.backfill", "Пересчет статистики уже загруженных миссий"),
+    "jobs": ("logic.jobs", "Очередь заданий в Mongo: enqueue, worker, status, retry"),
+    "stats": ("logic.leaderboard", "Таблицы игроков и отрядов"),
+    "bench": ("bench.run_bench", "Замеры производительности разбора"),
+}
+DEFAULT_COMMAND = "sync"
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv = [DEFAULT_COMMAND, *argv]
+
+    parser = argparse.ArgumentParser(
+        description="Статистика миссий RB",
+        epilog="Параметры команды: main.py <команда> --help",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        commands.add_parser(name, help=help_text, add_help=False)
+    args = parser.parse_args(argv[:1])
+
+    module_name, _ = COMMANDS[args.command]
+    importlib.import_module(module_name).main(argv[1:])
+
 
 if __name__ == "__main__":
-    while True:
-        try:
-            main()
-        except Exception as e:
-            print(f"Ошибка: {e}")
-        print("Перезапуск через 10 секунд...")
-        time.sleep(10)
+    main()
@@ -0,0 +1,90 @@
+from typing import Any, Iterable
+
+import numpy as np
+
+KILLS = "kills"
+DEATHS = "deaths"
+PRESENCE = "presence"
+LAYERS = (KILLS, DEATHS, PRESENCE)
+
+
+def grid_side(world_size: int, cell_size: int) -> int:
+    return -(-world_size // cell_size)
+
+
+def histogram(xs: np.ndarray, ys: np.ndarray, world_size: int, cell_size: int) -> np.ndarray:
+    """
+    Сетка side x side с числом точек в каждой клетке: строка - y, столбец - x.
+    Точки за пределами [0, world_size) отбрасываются.
+    """
+    side = grid_side(world_size, cell_size)
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    inside = (xs >= 0) & (ys >= 0) & (xs < world_size) & (ys < world_size)
+    cells = ys[inside] // cell_size * side + xs[inside] // cell_size
+    return np.bincount(cells, minlength=side * side).reshape(side, side)
+
+
+def _concat(xs: list[np.ndarray], ys: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    if not xs:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+def positions_at(entities: dict[int, Any], ids: Iterable[int], frames: Iterable[int]) -> tuple[np.ndarray, np.ndarray]:
+    """Координаты сущностей ids на абсолютных кадрах frames. Пары без сущности или без позиции на кадре пропускаются."""
+    ids = np.fromiter(ids, dtype=np.int64)
+    frames = np.fromiter(frames, dtype=np.int64)
+    xs, ys = [], []
+    for entity_id in np.unique(ids).tolist():
+        entity = entities.get(entity_id)
+        if entity is None:
+            continue
+        rows = frames[ids == entity_id] - entity.start_frame
+        rows = rows[(rows >= 0) & (rows < len(entity.positions))]
+        xs.append(entity.positions.x[rows])
+        ys.append(entity.positions.y[rows])
+    return _concat(xs, ys)
+
+
+def presence_positions(players: Iterable[Any], sample_every: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Позиции живых игроков на каждом sample_every-м абсолютном кадре - срезы колонок, без объектов по кадрам.
+    Юниты под управлением ИИ не учитываются.
+    """
+    xs, ys = [], []
+    for player in players:
+        alive = player.alive()
+        if alive is None:
+            continue
+        track = player.positions
+        rows = slice(-player.start_frame % sample_every, None, sample_every)
+        xs.append(track.x[rows][alive[rows]])
+        ys.append(track.y[rows][alive[rows]])
+    return _concat(xs, ys)
+
+
+def mission_grids(ocap: Any, world_size: int, cell_size: int, sample_every: int) -> dict[str, np.ndarray]:
+    """Сетки миссии: где стояли убийцы и жертвы на кадре убийства и где находились игроки."""
+    players = ocap.players or {}
+    entities = players | (ocap.vehicles or {})
+    events = ocap.events or []
+    frames = [e.frame for e in events]
+    return {
+        KILLS: histogram(*positions_at(entities, (e.killer.id for e in events), frames), world_size, cell_size),
+        DEATHS: histogram(*positions_at(entities, (e.killed.id for e in events), frames), world_size, cell_size),
+        PRESENCE: histogram(*presence_positions(players.values(), sample_every), world_size, cell_size),
+    }
+
+
+def to_cells(grid: np.ndarray) -> dict[str, list[int]]:
+    """Разреженная запись сетки: номера непустых клеток и их значения."""
+    flat = grid.ravel()
+    cells = np.flatnonzero(flat)
+    return {"cells": cells.tolist(), "counts": flat[cells].tolist()}
+
+
+def from_cells(cells: Iterable[int], counts: Iterable[int], side: int) -> np.ndarray:
+    cells = np.fromiter(cells, dtype=np.int64)
+    counts = np.fromiter(counts, dtype=np.int64, count=len(cells))
+    return np.bincount(cells, weights=counts, minlength=side * side).astype(np.int64).reshape(side, side)
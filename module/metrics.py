@@ -0,0 +1,249 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+METRICS_PREFIX = "parser"
+
+_current_trace: ContextVar["MissionTrace | None"] = ContextVar("current_trace", default=None)
+
+
+def _rss_peak_bytes() -> int:
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def rss_bytes() -> int:
+    """
+    Текущая анонимная память процесса (RssAnon). Страницы отображенных файлов не учитываются:
+    система может вытеснить их сама. Без /proc - пиковый RSS.
+    """
+    try:
+        with open("/proc/self/status", "rb") as fd:
+            for line in fd:
+                if line.startswith(b"RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return _rss_peak_bytes()
+
+
+class Registry:
+    """
+    Накопленные за время жизни процесса счетчики и время стадий.
+    Выгружается в текстовом формате Prometheus (для textfile collector node_exporter).
+    """
+
+    def __init__(self):
+        self.counters: dict[tuple[str, tuple], float] = defaultdict(float)
+        self.gauges: dict[tuple[str, tuple], float] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, stage_name: str, seconds: float) -> None:
+        self.inc("stage_seconds_total", seconds, stage=stage_name)
+        self.inc("stage_calls_total", 1, stage=stage_name)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+            by_name: dict[str, list] = defaultdict(list)
+            for (name, labels), value in values.items():
+                by_name[name].append((labels, value))
+            for name in sorted(by_name):
+                full_name = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# TYPE {full_name} {kind}")
+                for labels, value in sorted(by_name[name]):
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def _format_value(value: float) -> str:
+    # Целые (байты, счетчики) без экспоненты, чтобы не терять точность.
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+REGISTRY = Registry()
+
+
+class MissionTrace:
+    """
+    Замеры обработки одной миссии: время стадий, объемы (байты, сущности, события), прирост памяти.
+    Пока трасса активна (with trace:), stage() и count() пишут в нее, а не сразу в REGISTRY -
+    так замеры из процесса пула можно вернуть вместе с результатом и учесть в основном процессе.
+    """
+
+    def __init__(
+            self,
+            ocap_file: Path,
+            trace_memory: bool = False,
+            profile_path: Path | None = None,
+    ):
+        self.file = ocap_file.name
+        self.trace_memory = trace_memory
+        self.profile_path = profile_path
+        self.status = "ok"
+        self.stages: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+        # Прирост RSS за миссию: наибольший замер (концы стадий и выход) минус RSS при входе.
+        self.rss_growth_bytes = 0
+        self.alloc_peak_bytes: int | None = None
+        self.counts["bytes"] = ocap_file.stat().st_size if ocap_file.exists() else 0
+
+        self._token = None
+        self._started = 0.0
+        self._rss_start = 0
+        self._own_tracemalloc = False
+        self._profiler: cProfile.Profile | None = None
+
+    def add(self, stage_name: str, seconds: float) -> None:
+        self.stages[stage_name] += seconds
+        self._sample_rss()
+
+    def _sample_rss(self) -> None:
+        if self._token is not None:
+            self.rss_growth_bytes = max(self.rss_growth_bytes, rss_bytes() - self._rss_start)
+
+    def count(self, **values: int) -> None:
+        for name, value in values.items():
+            self.counts[name] += value
+
+    def __enter__(self) -> "MissionTrace":
+        if self.trace_memory:
+            self._own_tracemalloc = not tracemalloc.is_tracing()
+            if self._own_tracemalloc:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.profile_path is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._token = _current_trace.set(self)
+        self._rss_start = rss_bytes()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.add("total", time.perf_counter() - self._started)  # и последний замер RSS
+        _current_trace.reset(self._token)
+        self._token = None  # Трасса возвращается из процесса пула, Token не сериализуется.
+        if exc_type is not None:
+            self.status = "error"
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile_path.parent.mkdir(parents=True, exist_ok=True)
+            self._profiler.dump_stats(self.profile_path)
+            self._profiler = None
+        if self.trace_memory:
+            self.alloc_peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self._own_tracemalloc:
+                tracemalloc.stop()
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {
+            "file": self.file,
+            "status": self.status,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            **self.counts,
+            "rss_growth_bytes": self.rss_growth_bytes,
+        }
+        if self.alloc_peak_bytes is not None:
+            data["alloc_peak_bytes"] = self.alloc_peak_bytes
+        return data
+
+
+def add_stage(stage_name: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage_name, seconds)
+    else:
+        REGISTRY.observe(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name: str) -> Iterator[None]:
+    """Время блока: в активную трассу миссии, а без нее - сразу в REGISTRY."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage(stage_name, time.perf_counter() - started)
+
+
+def count(**values: int) -> None:
+    """Объемы (байты, сущности, события): в активную трассу миссии, а без нее - в REGISTRY."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(**values)
+        return
+    for name, value in values.items():
+        REGISTRY.inc(f"{name}_total", value)
+
+
+class Stopwatch:
+    """Суммарное время, проведенное внутри итератора, - например, в декодировании JSON при потоковом чтении."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def iterate(self, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds += time.perf_counter() - started
+                return
+            self.seconds += time.perf_counter() - started
+            yield item
+
+
+def record_mission(trace: MissionTrace, log_file: Path | None = None) -> None:
+    """Учитывает замеры миссии в REGISTRY и пишет их строкой JSON в log_file."""
+    REGISTRY.inc("missions_total", 1, status=trace.status)
+    for stage_name, seconds in trace.stages.items():
+        REGISTRY.observe(stage_name, seconds)
+    for name, value in trace.counts.items():
+        REGISTRY.inc(f"mission_{name}_total", value)
+    REGISTRY.set("last_mission_seconds", trace.stages.get("total", 0.0))
+    REGISTRY.set("last_mission_rss_growth_bytes", trace.rss_growth_bytes)
+    if trace.alloc_peak_bytes is not None:
+        REGISTRY.set("last_mission_alloc_peak_bytes", trace.alloc_peak_bytes)
+    log_event(log_file, "mission", **trace.to_dict())
+
+
+def log_event(log_file: Path | None, event: str, **fields: Any) -> None:
+    """Строка структурированного лога (JSON Lines). Без log_file ничего не пишет."""
+    if log_file is None:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, **fields}
+    with log_file.open("a", encoding="utf-8") as fd:
+        fd.write(json.dumps(record, ensure_ascii=False) + "\n")
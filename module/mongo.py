@@ -0,0 +1,50 @@
+import threading
+from typing import Any
+
+
+class LazyDatabase:
+    """
+    База Mongo, которая подключается при первом обращении к коллекции, а не при импорте.
+    Команды, которым Mongo не нужна, не импортируют pymongo и не требуют запущенного сервера,
+    а процессы, созданные через fork до первого запроса, не наследуют клиент родителя.
+    """
+
+    def __init__(self, uri: str, name: str):
+        self.uri = uri
+        self.name = name
+        self._database = None
+        self._lock = threading.Lock()
+
+    @property
+    def database(self) -> Any:
+        if self._database is None:
+            with self._lock:
+                if self._database is None:
+                    from pymongo import MongoClient
+
+                    self._database = MongoClient(self.uri)[self.name]
+        return self._database
+
+    @property
+    def client(self) -> Any:
+        return self.database.client
+
+    def __getitem__(self, name: str) -> "LazyCollection":
+        return LazyCollection(self, name)
+
+
+class LazyCollection:
+    """Коллекция LazyDatabase: атрибуты и методы берутся у коллекции pymongo, созданной при первом обращении."""
+
+    def __init__(self, db: LazyDatabase, name: str):
+        self._db = db
+        self._name = name
+        self._collection = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._collection is None:
+            self._collection = self._db.database[self._name]
+        return getattr(self._collection, attr)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self._db.name}.{self._name})"
@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import io
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, TextIO
+
+GZIP = "gzip"
+ZSTD = "zstd"
+COMPRESSIONS = (GZIP, ZSTD)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+DEFAULT_LEVELS = {GZIP: 6, ZSTD: 10}
+
+
+class OcapArchiveError(ValueError):
+    pass
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise OcapArchiveError("Для сжатия zstd нужен пакет zstandard: pip install zstandard") from e
+    return zstandard
+
+
+def detect_compression(path: Path) -> str | None:
+    """Формат файла по первым байтам: gzip, zstd или None для несжатого JSON."""
+    with path.open("rb") as fd:
+        head = fd.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return GZIP
+    if head.startswith(ZSTD_MAGIC):
+        return ZSTD
+    return None
+
+
+def open_ocap(path: Path) -> BinaryIO:
+    """
+    Файл OCAP как поток байт исходного JSON. Сжатые файлы распаковываются по мере чтения,
+    имя файла при этом не меняется - формат определяется по содержимому.
+    """
+    compression = detect_compression(path)
+    if compression == GZIP:
+        return gzip.open(path, "rb")
+    if compression == ZSTD:
+        decompressor = _zstandard().ZstdDecompressor()
+        return decompressor.stream_reader(path.open("rb"), read_across_frames=True, closefd=True)
+    return path.open("rb")
+
+
+def open_ocap_text(path: Path) -> TextIO:
+    return io.TextIOWrapper(open_ocap(path), encoding="UTF-8")
+
+
+@contextmanager
+def compressing_writer(fd: BinaryIO, compression: str | None, level: int | None = None) -> Iterator[BinaryIO]:
+    """Обертка над открытым файлом, сжимающая все записанное. fd после выхода остается открытым."""
+    if compression is None:
+        yield fd
+        return
+    if compression not in COMPRESSIONS:
+        raise OcapArchiveError(f"Неизвестное сжатие {compression!r}, ожидалось одно из {COMPRESSIONS}")
+
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == GZIP:
+        # mtime=0 - одинаковый файл дает одинаковый архив, хэш для кэша разбора не плавает.
+        writer = gzip.GzipFile(fileobj=fd, mode="wb", compresslevel=level, mtime=0)
+    else:
+        writer = _zstandard().ZstdCompressor(level=level).stream_writer(fd, closefd=False)
+    with writer:
+        yield writer
+
+
+def read_through(path: Path, chunk_size: int = 1 << 20) -> tuple[int, str]:
+    """Читает файл OCAP целиком через open_ocap. Возвращает размер исходного JSON и его хэш."""
+    digest = hashlib.blake2b()
+    raw_size = 0
+    with open_ocap(path) as source:
+        while chunk := source.read(chunk_size):
+            digest.update(chunk)
+            raw_size += len(chunk)
+    return raw_size, digest.hexdigest()
+
+
+def recompress_file(
+        path: Path,
+        compression: str | None,
+        level: int | None = None,
+        chunk_size: int = 1 << 20,
+) -> dict[str, float]:
+    """
+    Перепаковывает файл OCAP в compression (None - распаковать) под тем же именем.
+    Запись идет во временный файл рядом; он читается обратно и сверяется по хэшу содержимого,
+    и только после этого атомарно заменяет исходный. mtime сохраняется.
+    Возвращает размеры до/после, размер JSON и время записи и проверочного чтения.
+    """
+    stat = path.stat()
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    digest = hashlib.blake2b()
+    raw_size = 0
+    try:
+        started = time.perf_counter()
+        with open_ocap(path) as source, tmp_path.open("wb") as target:
+            with compressing_writer(target, compression, level) as writer:
+                while chunk := source.read(chunk_size):
+                    writer.write(chunk)
+                    digest.update(chunk)
+                    raw_size += len(chunk)
+            target.flush()
+            os.fsync(target.fileno())
+        write_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if read_through(tmp_path, chunk_size) != (raw_size, digest.hexdigest()):
+            raise OcapArchiveError(f"{path.name}: перепакованный файл не совпадает с исходным")
+        read_seconds = time.perf_counter() - started
+
+        os.chmod(tmp_path, stat.st_mode & 0o777)
+        os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        stored_size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return {
+        "raw_bytes": raw_size,
+        "before_bytes": stat.st_size,
+        "stored_bytes": stored_size,
+        "write_seconds": write_seconds,
+        "read_seconds": read_seconds,
+    }
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any
+
+from module.ocap_models import OCAP, KillEventRaw, PARSER_VERSION, resolve_killer_vehicles, resolve_vehicle_crews
+
+CACHE_SUFFIX = ".ocache"
+
+
+class OcapCache:
+    """
+    Кэш разобранных миссий на диске. Ключ - хэш содержимого файла OCAP и PARSER_VERSION,
+    поэтому переименование файла кэш не сбрасывает, а смена версии разбора - сбрасывает.
+    В кэше лежат игроки, ТС, сырые события убийств и найденные ТС убийц; KillEvent собираются
+    заново при загрузке, так что правки WEAPON_RENAMED повторного разбора не требуют.
+    Размер каталога ограничен max_bytes, вытесняются давно не читанные записи.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, parser_version: int = PARSER_VERSION):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.parser_version = parser_version
+        self.hits = 0
+        self.misses = 0
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(self, ocap_path: Path) -> str:
+        with ocap_path.open("rb") as fd:
+            digest = hashlib.file_digest(fd, "blake2b").hexdigest()[:32]
+        return f"v{self.parser_version}_{digest}"
+
+    def _entry(self, key: str) -> Path:
+        return self.path / f"{key}{CACHE_SUFFIX}"
+
+    def get(self, key: str, ocap_path: Path, spread: int) -> OCAP | None:
+        entry = self._entry(key)
+        try:
+            with entry.open("rb") as fd:
+                payload = pickle.load(fd)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            print(f"Поврежденная запись кэша {entry.name}: {e}")
+            entry.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        ocap = OCAP.from_parts(
+            ocap_path,
+            payload["players"],
+            payload["vehicles"],
+            payload["raw_events"],
+            trusted=True,  # Сущности и события в кэше уже прошли разбор, повторная валидация не нужна.
+            **payload["fields"],
+        )
+        if payload["spread"] == spread:
+            killer_vehicle_ids = payload["killer_vehicle_ids"]
+        else:
+            killer_vehicle_ids = resolve_killer_vehicles(ocap, ocap.events, spread)
+        ocap.set_killer_vehicles(killer_vehicle_ids)
+        # Экипажи не хранятся: пересчет дешевый и не зависит от версии записи.
+        ocap.set_killer_vehicle_crews(resolve_vehicle_crews(ocap, ocap.events))
+
+        os.utime(entry)  # Отметка для вытеснения давно не читанных записей.
+        self.hits += 1
+        return ocap
+
+    def put(
+            self,
+            key: str,
+            ocap: OCAP,
+            raw_events: list[KillEventRaw],
+            killer_vehicle_ids: list[int | None],
+            spread: int,
+    ) -> None:
+        payload: dict[str, Any] = {
+            "players": ocap.players,
+            "vehicles": ocap.vehicles,
+            "raw_events": raw_events,
+            "killer_vehicle_ids": killer_vehicle_ids,
+            "spread": spread,
+            "fields": {
+                "max_frame": ocap.max_frame,
+                "mission_name": ocap.mission_name,
+                "world_name": ocap.world_name,
+                "win_side": ocap.win_side,
+            },
+        }
+        entry = self._entry(key)
+        # Временное имя уникально для процесса: миссии могут разбираться в пуле параллельно.
+        tmp_entry = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+        with tmp_entry.open("wb") as fd:
+            pickle.dump(payload, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_entry, entry)
+        self.prune()
+
+    def prune(self) -> None:
+        """Удаляет записи других версий разбора и самые старые записи сверх max_bytes."""
+        entries = []
+        for entry in self.path.glob(f"*{CACHE_SUFFIX}"):
+            if not entry.name.startswith(f"v{self.parser_version}_"):
+                entry.unlink(missing_ok=True)
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
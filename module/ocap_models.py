@@ -1,16 +1,35 @@
 import json
-import threading
-from collections import defaultdict
-from contextlib import suppress
+import sys
+from collections import defaultdict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain
 from datetime import datetime, time
 from enum import StrEnum
 from pathlib import Path
-from queue import Queue, Empty
-from typing import Any
+from operator import itemgetter
+from queue import Queue
+from time import perf_counter
+from typing import Any, Iterable
 
-from pydantic import BaseModel, Field, model_validator, field_validator
+import numpy as np
+from pydantic import BaseModel, Field, PrivateAttr, model_validator, field_validator
+from pydantic_core import core_schema
+
+from module.metrics import Stopwatch, add_stage, count, stage
+from module.ocap_stream import OcapReader, OcapStreamError, ENTITIES_KEY, ENTITY_BATCH_KEY, EVENTS_KEY
+from module.spatial_index import FrameIndex
+from module.track_spill import MemoryGuard, TrackSpill
 
 OCAPS_PLY_VEHICLES_SPREAD_COORDS = 10
+# Экипаж пишется в OCAP координатами своей ТС, поэтому окно для поиска экипажа узкое:
+# широкое захватывало бы пехоту, идущую рядом с техникой.
+OCAPS_CREW_SPREAD_COORDS = 3
+
+# Версия разбора OCAP. Увеличивать при любом изменении моделей или разбора - от нее зависит кэш.
+PARSER_VERSION = 2
+
+# Сколько текста сущностей отдавать в пул разбора за раз (OCAP.from_file(parse_workers=...)).
+ENTITY_BATCH_CHARS = 2 << 20
 
 WEAPON_RENAMED = {
     "РПГ-26 (отстрелянный)": "РПГ-26",
@@ -121,13 +140,222 @@ class PlayerPosition(BaseModel):
         )
 
 
+def _int_column(values: list, field: str, trusted: bool = False) -> np.ndarray:
+    if trusted:
+        return np.asarray(values, dtype=np.int32)
+    # Та же проверка, что у pydantic для int: допускаются только целые значения.
+    try:
+        column = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{field}: ожидались целые числа") from e
+    if column.size and not np.all(np.isfinite(column) & (column == np.trunc(column))):
+        raise ValueError(f"{field}: ожидались целые числа")
+    return column.astype(np.int32)
+
+
+def _column(data: list, index: int, field: str, trusted: bool = False) -> np.ndarray:
+    try:
+        return _int_column([pos[index] for pos in data], field, trusted)
+    except IndexError as e:
+        raise ValueError(f"{field}: поле обязательно") from e
+
+
+def _coords_columns(data: list) -> tuple[np.ndarray, np.ndarray]:
+    try:
+        # Обычно у всех кадров одинаковое число координат ([x, y] у юнитов, [x, y, z] у ТС) -
+        # тогда массив строится без среза каждого кадра.
+        coords = np.asarray(list(map(itemgetter(0), data)), dtype=np.float64)
+        if coords.ndim != 2 or coords.shape[1] < 2:
+            raise ValueError
+        coords = coords[:, :2]
+    except (TypeError, ValueError, IndexError):
+        try:
+            coords = np.asarray([pos[0][:2] for pos in data], dtype=np.float64).reshape(-1, 2)
+        except (TypeError, ValueError, IndexError) as e:
+            raise ValueError("coordinates: ожидался список [x, y]") from e
+    # np.rint, как и round(), округляет половины к четному.
+    coords = np.rint(coords).astype(np.int32)
+    return coords[:, 0].copy(), coords[:, 1].copy()
+
+
+class PositionTrack:
+    """
+    Колоночное хранение позиций ТС: x, y, azimuth лежат в массивах numpy,
+    а не тремя pydantic-объектами на кадр. positions[frame] собирает Position по требованию.
+    """
+    __slots__ = ("x", "y", "azimuth")
+    # Колонки по кадрам, которые можно выгрузить на диск (все int32).
+    columns = ("x", "y", "azimuth")
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, azimuth: np.ndarray):
+        self.x = x
+        self.y = y
+        self.azimuth = azimuth
+
+    @classmethod
+    def from_ocap(cls, data: list, trusted: bool = False) -> "PositionTrack":
+        x, y = _coords_columns(data)
+        return cls(x, y, _column(data, 1, "azimuth", trusted))
+
+    @classmethod
+    def validate(cls, data: Any) -> "PositionTrack":
+        if isinstance(data, cls):
+            return data
+        return cls.from_ocap(list(data))
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: Any) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(cls.to_list),
+        )
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def __getitem__(self, frame: int) -> Position:
+        return Position.model_construct(
+            coordinates=Coordinates.model_construct(x=int(self.x[frame]), y=int(self.y[frame])),
+            azimuth=int(self.azimuth[frame]),
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(np.array_equal(getattr(self, f), getattr(other, f)) for f in self.__slots__)
+
+    def spill_to(self, spill: TrackSpill) -> None:
+        """Переносит колонки в файл spill: вместо массивов остаются memmap только для чтения."""
+        for name, column in zip(self.columns, spill.spill([getattr(self, name) for name in self.columns])):
+            setattr(self, name, column)
+
+    def to_list(self) -> list:
+        return [[[x, y], az] for x, y, az in zip(self.x.tolist(), self.y.tolist(), self.azimuth.tolist())]
+
+
+class PlayerPositionTrack(PositionTrack):
+    """
+    Колоночное хранение позиций юнита. Ник на кадре хранится кодом в name_codes,
+    сами строки - один раз в names.
+    """
+    __slots__ = ("dump_data_first", "dump_data_second", "name_codes", "names")
+    columns = (*PositionTrack.columns, "dump_data_first", "dump_data_second", "name_codes")
+
+    def __init__(
+            self,
+            x: np.ndarray,
+            y: np.ndarray,
+            azimuth: np.ndarray,
+            dump_data_first: np.ndarray,
+            dump_data_second: np.ndarray,
+            name_codes: np.ndarray,
+            names: tuple[str, ...],
+    ):
+        super().__init__(x, y, azimuth)
+        self.dump_data_first = dump_data_first
+        self.dump_data_second = dump_data_second
+        self.name_codes = name_codes
+        self.names = names
+
+    @classmethod
+    def from_ocap(cls, data: list, trusted: bool = False) -> "PlayerPositionTrack":
+        x, y = _coords_columns(data)
+        try:
+            frame_names = list(map(itemgetter(4), data))
+        except IndexError as e:
+            raise ValueError("player_name: поле обязательно") from e
+        # Ников на юнита единицы, поэтому тип проверяется у уникальных, а не на каждом кадре.
+        names = {name: code for code, name in enumerate(dict.fromkeys(frame_names))}
+        if not trusted and not all(isinstance(name, str) for name in names):
+            raise ValueError("player_name: ожидалась строка")
+        return cls(
+            x,
+            y,
+            _column(data, 1, "azimuth", trusted),
+            _column(data, 2, "dump_data_first", trusted),
+            _column(data, 3, "dump_data_second", trusted),
+            np.fromiter(map(names.__getitem__, frame_names), dtype=np.int32, count=len(frame_names)),
+            tuple(sys.intern(n) for n in names),
+        )
+
+    def __getitem__(self, frame: int) -> PlayerPosition:
+        return PlayerPosition.model_construct(
+            coordinates=Coordinates.model_construct(x=int(self.x[frame]), y=int(self.y[frame])),
+            azimuth=int(self.azimuth[frame]),
+            dump_data_first=int(self.dump_data_first[frame]),
+            dump_data_second=int(self.dump_data_second[frame]),
+            player_name=self.names[self.name_codes[frame]],
+        )
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        # Коды ников зависят от порядка появления, сравниваем сами строки.
+        return (
+            all(np.array_equal(getattr(self, f), getattr(other, f)) for f in PositionTrack.__slots__)
+            and np.array_equal(self.dump_data_first, other.dump_data_first)
+            and np.array_equal(self.dump_data_second, other.dump_data_second)
+            and self.player_names() == other.player_names()
+        )
+
+    def player_names(self) -> list[str]:
+        return [self.names[c] for c in self.name_codes.tolist()]
+
+    def alive(self) -> np.ndarray:
+        """Маска кадров, на которых юнит жив: третье поле позиции в OCAP - состояние, 0 - мертв."""
+        return self.dump_data_first != 0
+
+    def in_vehicle(self) -> np.ndarray:
+        """Маска кадров, на которых юнит сидит в ТС: четвертое поле позиции в OCAP."""
+        return self.dump_data_second != 0
+
+    def first_other_name(self, name: str) -> str | None:
+        """Первый непустой ник на кадрах, отличный от name, без перебора объектов по кадрам."""
+        other = [code for code, n in enumerate(self.names) if n and n != name]
+        if not other:
+            return None
+        hits = np.flatnonzero(np.isin(self.name_codes, other))
+        return self.names[self.name_codes[hits[0]]] if hits.size else None
+
+    def to_list(self) -> list:
+        return [
+            [[x, y], az, first, second, name]
+            for x, y, az, first, second, name in zip(
+                self.x.tolist(),
+                self.y.tolist(),
+                self.azimuth.tolist(),
+                self.dump_data_first.tolist(),
+                self.dump_data_second.tolist(),
+                self.player_names(),
+            )
+        ]
+
+
 class Vehicle(BaseModel):
     id: int
     name: str
     entity_type: EntityType = Field(alias="type")
     vehicle_type: VehicleType | None = Field(None, alias="class")
     start_frame: int = Field(alias="startFrameNum")
-    positions: tuple[Position, ...]
+    positions: PositionTrack
+
+    @classmethod
+    def from_entity(cls, entity: dict, trusted: bool = False) -> "Vehicle":
+        """trusted=True - сборка без валидации pydantic, для файлов с нашего сервера OCAP."""
+        if not trusted:
+            return cls(**entity)
+        vehicle_type = entity.get("class")
+        return cls.model_construct(
+            id=entity["id"],
+            name=entity["name"],
+            entity_type=EntityType(entity["type"]),
+            vehicle_type=VehicleType(vehicle_type) if vehicle_type is not None else None,
+            start_frame=entity["startFrameNum"],
+            positions=PositionTrack.from_ocap(entity["positions"], trusted=True),
+        )
 
     @classmethod
     def map_from_ocap(cls, data: dict) -> dict[int, "Vehicle"]:
@@ -156,7 +384,27 @@ class Player(BaseModel):
     is_player: bool = Field(alias="isPlayer")
     entity_type: EntityType = Field(alias="type")
     start_frame: int = Field(alias="startFrameNum")
-    positions: tuple[PlayerPosition, ...]
+    positions: PlayerPositionTrack
+
+    def alive(self) -> np.ndarray | None:
+        """Маска кадров, на которых игрок жив. None - юнит под управлением ИИ: в сводки игроков он не входит."""
+        return self.positions.alive() if self.is_player else None
+
+    @classmethod
+    def from_entity(cls, entity: dict, trusted: bool = False) -> "Player":
+        """trusted=True - сборка без валидации pydantic, для файлов с нашего сервера OCAP."""
+        if not trusted:
+            return cls(**entity)
+        return cls.model_construct(
+            id=entity["id"],
+            group=entity["group"],
+            name=entity["name"],
+            side=entity["side"],
+            is_player=bool(entity["isPlayer"]),
+            entity_type=EntityType(entity["type"]),
+            start_frame=entity["startFrameNum"],
+            positions=PlayerPositionTrack.from_ocap(entity["positions"], trusted=True),
+        )
 
     @classmethod
     def map_from_ocap(cls, data: dict) -> dict[int, "Player"]:
@@ -196,6 +444,14 @@ class KillFrag(BaseModel):
             fields_to_values["killer"] = None
         return fields_to_values
 
+    @classmethod
+    def construct_trusted(cls, data: list) -> "KillFrag":
+        killer = data[0] if data else None
+        return cls.model_construct(
+            killer=None if killer == "null" else killer,
+            weapon=data[1] if len(data) > 1 else None,
+        )
+
 
 class KillEventRaw(BaseModel):
     frame: int
@@ -205,7 +461,15 @@ class KillEventRaw(BaseModel):
     distance: int
 
     @classmethod
-    def ocap_constructor(cls, data: list[Any]) -> "KillEventRaw":
+    def ocap_constructor(cls, data: list[Any], trusted: bool = False) -> "KillEventRaw":
+        if trusted:
+            return cls.model_construct(
+                frame=data[0],
+                event_type=EventType(data[1]),
+                killed=data[2],
+                frag=KillFrag.construct_trusted(data[3]) if len(data) > 3 and data[3] is not None else None,
+                distance=data[4],
+            )
         fields_to_values = dict(
             zip(
                 vars(cls)["__annotations__"], data
@@ -277,156 +541,432 @@ class KillEvent(BaseModel):
         cls,
         players: dict[int, Player],
         vehicles: dict[int, Vehicle],
-        raw_kills: list["KillEventRaw"]
+        raw_kills: list["KillEventRaw"],
+        trusted: bool = False,
     ) -> list["KillEvent"]:
+        """trusted=True - сборка без валидации pydantic, переименование оружия применяется так же."""
+        entities = players | vehicles
+        if trusted:
+            return [
+                cls.model_construct(
+                    frame=event.frame,
+                    event_type=event.event_type,
+                    killed=entities[event.killed],
+                    killer=players[event.frag.killer],
+                    weapon=cls.correct_weapons_rename(event.frag.weapon or "unknown"),
+                    distance=event.distance,
+                )
+                for event in raw_kills
+                if entities.get(event.killed) and players.get(event.frag.killer)
+            ]
         return [
             cls(
                 frame=event.frame,
                 event_type=event.event_type,
-                killed=(players | vehicles)[event.killed],
+                killed=entities[event.killed],
                 killer=players[event.frag.killer],
                 weapon=event.frag.weapon or "unknown",
                 distance=event.distance,
             )
             for event in raw_kills
-            if (players | vehicles).get(event.killed) and players.get(event.frag.killer)
+            if entities.get(event.killed) and players.get(event.frag.killer)
         ]
 
 class OCAP(BaseModel):
     players: dict[int, Player] | None = None
     vehicles: dict[int, Vehicle] | None = None
     events: list[KillEvent] | None = None
-    positions: Any | None = None
     game_type: GameType
     max_frame: int
+    mission_name: str | None = "Unknown Mission"
+    world_name: str | None = "Unknown World"
+    win_side: str | None = None
+
+    _positions: Any | None = PrivateAttr(None)
+    _vehicle_index: FrameIndex | None = PrivateAttr(None)
+    _kill_frames: frozenset[int] | None = PrivateAttr(None)
+    _kill_vehicle_index: FrameIndex | None = PrivateAttr(None)
+    _unit_index: FrameIndex | None = PrivateAttr(None)
+
+    @property
+    def positions(self) -> Any:
+        """
+        Полный словарь координат positions[entity_type][frame][(x, y)] -> [id] по всем кадрам.
+        Для разбора не нужен, дорог в построении, поэтому строится только при первом обращении.
+        """
+        if self._positions is None:
+            self._positions = build_positions(self.players or {}, self.vehicles or {})
+        return self._positions
+
+    @property
+    def kill_frames(self) -> frozenset[int]:
+        if self._kill_frames is None:
+            self._kill_frames = frozenset(e.frame for e in self.events or ())
+        return self._kill_frames
+
+    @property
+    def vehicle_index(self) -> FrameIndex:
+        """Позиции ТС по всем кадрам. Строится при первом обращении."""
+        if self._vehicle_index is None:
+            self._vehicle_index = FrameIndex((self.vehicles or {}).values())
+        return self._vehicle_index
+
+    @property
+    def kill_vehicle_index(self) -> FrameIndex:
+        """Позиции ТС только на кадрах убийств - все, что нужно для поиска ТС убийцы."""
+        if self._kill_vehicle_index is None:
+            self._kill_vehicle_index = FrameIndex((self.vehicles or {}).values(), frames=self.kill_frames)
+        return self._kill_vehicle_index
+
+    @property
+    def unit_index(self) -> FrameIndex:
+        """Позиции юнитов по кадрам для поиска экипажа ТС. Строится при первом обращении."""
+        if self._unit_index is None:
+            self._unit_index = FrameIndex((self.players or {}).values())
+        return self._unit_index
 
     @classmethod
-    def from_file(cls, path: Path) -> "OCAP":
-        with path.open("r", encoding="UTF-8") as fd:
-            data = json.load(fd)
-
-        queue = Queue()
-
-        players_thread = threading.Thread(target=Player.map_from_ocap_queued, args=(data, queue), daemon=True)
-        players_thread.start()
-        vehicles_thread = threading.Thread(target=Vehicle.map_from_ocap_queued, args=(data, queue), daemon=True)
-        vehicles_thread.start()
-        events_thread = threading.Thread(target=KillEventRaw.list_from_ocap_queued, args=(data, queue), daemon=True)
-        events_thread.start()
-
-        players_thread.join()
-        vehicles_thread.join()
-        events_thread.join()
-
-        thread_1, thread_2, thread_3 = {}, {}, {}
-        with suppress(Empty):
-            thread_1 = queue.get_nowait()
-        with suppress(Empty):
-            thread_2 = queue.get_nowait()
-        with suppress(Empty):
-            thread_3 = queue.get_nowait()
-
-        threads_data = thread_1 | thread_2 | thread_3
-        players = threads_data.get("players", {})
-        vehicles = threads_data.get("vehicles", {})
-        events = threads_data.get("events", {})
-
-        events = KillEvent.map_from_ocap(players, vehicles, events)
-
-        positions = defaultdict(
-            lambda: defaultdict(
-                lambda: defaultdict(list[int])
+    def from_file(
+            cls,
+            path: Path,
+            spread: int = OCAPS_PLY_VEHICLES_SPREAD_COORDS,
+            cache: Any | None = None,
+            trusted: bool = False,
+            sparse_index: bool = True,
+            memory: MemoryGuard | None = None,
+            parse_workers: int = 1,
+    ) -> "OCAP":
+        """
+        :param cache: module.ocap_cache.OcapCache - если передан, разобранная миссия берется из кэша
+            или сохраняется в него после разбора.
+        :param trusted: собирать модели без валидации pydantic (model_construct). Только для файлов
+            с нашего сервера OCAP: битые данные в этом режиме не отлавливаются.
+        :param sparse_index: ТС убийц ищутся по индексу только кадров убийств (kill_vehicle_index),
+            а не по всем кадрам записи. Результат одинаковый, False оставлен для сравнения.
+        :param memory: ограничение памяти для больших записей. Если колонки позиций пришлось выгрузить
+            на диск, миссия не кладется в кэш: при чтении из кэша она целиком легла бы в память.
+        :param parse_workers: сколько процессов (потоков на интерпретаторе без GIL) разбирают сущности
+            одного файла. Имеет смысл для больших записей при последовательной обработке миссий.
+        """
+        cache_key = None
+        if cache is not None:
+            with stage("cache_lookup"):
+                cache_key = cache.key(path)
+                ocap = cache.get(cache_key, path, spread)
+            if ocap is not None:
+                count(cache_hits=1, players=len(ocap.players), vehicles=len(ocap.vehicles), kill_events=len(ocap.events))
+                return ocap
+
+        try:
+            reader, players, vehicles, raw_events = cls._read(path, trusted, memory, parse_workers)
+        except OcapStreamError as e:
+            if parse_workers <= 1:
+                raise
+            # Скорее всего скобка в строке сбила разрезание на куски; последовательный разбор
+            # либо справится, либо выдаст настоящую ошибку файла.
+            print(f"{path.name}: параллельный разбор не удался ({e}), разбираю последовательно")
+            reader, players, vehicles, raw_events = cls._read(path, trusted, memory, 1)
+
+        with stage("build_events"):
+            ocap = cls.from_parts(
+                path,
+                players,
+                vehicles,
+                raw_events,
+                trusted=trusted,
+                max_frame=count_frames(players.values()) - 1,  # -1, т.к. отсчет кадров идет с нуля.
+                mission_name=reader.mission_name,
+                world_name=reader.world_name,
+                win_side=reader.win_side,
             )
-        )
-        for i in (players | vehicles).values():
-            for frame, pos in enumerate(i.positions):
-                positions[i.entity_type][frame + i.start_frame][
-                    (pos.coordinates.x, pos.coordinates.y)
-                ].append(i.id)
-
-        ocap = cls(
-            players=players,
-            vehicles=vehicles,
-            events=events,
-            positions=positions,
-            max_frame=len(positions[EntityType.UNIT]) - 1,  # -1, т.к. отсчет кадров идет с нуля, длину считает с 1.
-            game_type=get_game_type_from_file(path)
-        )
 
         # Заполнение ника, если игрок вылетел и стал ботом.
         for p in ocap.players.values():
             p: Player
             if not p.is_player and p.positions:
-                for pos in p.positions:
-                    if pos.player_name and p.name != pos.player_name:
-                        p.name = f"{pos.player_name} [AI]"
-                        break
+                player_name = p.positions.first_other_name(p.name)
+                if player_name:
+                    p.name = f"{player_name} [AI]"
 
         # Заполнение ТС, на котором был убийца во время фрага.
-        for e in ocap.events:
-            killer_vehicle_id = parse_player_vehicle_id(ocap, e.killer.id, e.frame)
+        with stage("vehicle_resolve"):
+            killer_vehicle_ids = resolve_killer_vehicles(ocap, ocap.events, spread, sparse_index)
+            ocap.set_killer_vehicles(killer_vehicle_ids)
+        # Экипаж ТС убийцы, чтобы фраг можно было засчитать всем, кто в ней был.
+        with stage("crew_resolve"):
+            ocap.set_killer_vehicle_crews(resolve_vehicle_crews(ocap, ocap.events))
+
+        if memory is not None and memory.spilled:
+            count(spilled_missions=1, spilled_bytes=memory.spill.bytes)
+        elif cache is not None:
+            with stage("cache_store"):
+                cache.put(cache_key, ocap, raw_events, killer_vehicle_ids, spread)
+        return ocap
+
+    @classmethod
+    def _read(
+            cls,
+            path: Path,
+            trusted: bool,
+            memory: MemoryGuard | None,
+            parse_workers: int,
+    ) -> tuple[OcapReader, dict[int, "Player"], dict[int, "Vehicle"], list[KillEventRaw]]:
+        """
+        Файл читается один раз потоково, целиком JSON в памяти не держится.
+        При parse_workers > 1 сущности уходят в пул кусками сырого текста и декодируются и валидируются
+        там, а события разбираются здесь же, пока пул занят. Результаты кусков собираются строго
+        в порядке файла, поэтому миссия получается та же, что при последовательном разборе.
+        """
+        executor = parse_executor(parse_workers) if parse_workers > 1 else None
+        reader = OcapReader(path, entity_batch_chars=ENTITY_BATCH_CHARS if executor else None)
+        decode = Stopwatch()
+        players: dict[int, Player] = {}
+        vehicles: dict[int, Vehicle] = {}
+        raw_events: list[KillEventRaw] = []
+        pending: deque[Future] = deque()
+        entities_count = events_count = 0
+
+        def add(models: list[Player | Vehicle]) -> None:
+            for model in models:
+                if isinstance(model, Player):
+                    players[model.id] = model
+                else:
+                    vehicles[model.id] = model
+                if memory is not None:
+                    memory.admit(model, chain(players.values(), vehicles.values()))
+
+        def merge_next() -> None:
+            nonlocal entities_count
+            batch_count, models = pending.popleft().result()
+            entities_count += batch_count
+            add(models)
+
+        read_started = perf_counter()
+        try:
+            for key, item in decode.iterate(reader):
+                if key == ENTITIES_KEY:
+                    entities_count += 1
+                    add(entity_models(item, trusted))
+                elif key == ENTITY_BATCH_KEY:
+                    pending.append(executor.submit(parse_entity_batch, item, trusted))
+                    # Не больше двух кусков на процесс в очереди: текст сущностей не копится в памяти.
+                    while len(pending) > 2 * parse_workers:
+                        merge_next()
+                elif key == EVENTS_KEY:
+                    events_count += 1
+                    if item[1] == EventType.KILL:
+                        raw_events.append(KillEventRaw.ocap_constructor(item, trusted))
+            while pending:
+                merge_next()
+        finally:
+            for future in pending:
+                future.cancel()
+
+        add_stage("json_decode", decode.seconds)
+        add_stage("validate", perf_counter() - read_started - decode.seconds)
+        count(
+            entities=entities_count,
+            players=len(players),
+            vehicles=len(vehicles),
+            events=events_count,
+            kill_events=len(raw_events),
+        )
+        return reader, players, vehicles, raw_events
+
+    @classmethod
+    def from_parts(
+            cls,
+            path: Path,
+            players: dict[int, Player],
+            vehicles: dict[int, Vehicle],
+            raw_events: list[KillEventRaw],
+            trusted: bool = False,
+            **fields: Any,
+    ) -> "OCAP":
+        """Сборка миссии из уже разобранных сущностей и сырых событий убийств."""
+        events = KillEvent.map_from_ocap(players, vehicles, raw_events, trusted)
+        if trusted:
+            return cls.model_construct(
+                players=players,
+                vehicles=vehicles,
+                events=events,
+                game_type=get_game_type_from_file(path),
+                **fields,
+            )
+        return cls(
+            players=players,
+            vehicles=vehicles,
+            events=events,
+            game_type=get_game_type_from_file(path),
+            **fields,
+        )
+
+    def set_killer_vehicles(self, killer_vehicle_ids: list[int | None]) -> None:
+        for e, killer_vehicle_id in zip(self.events, killer_vehicle_ids):
             if killer_vehicle_id:
-                e.killer_vehicle = vehicles[killer_vehicle_id]
-                # TODO Тут должен писаться экипаж, чтобы фраг считался всему экипажу, а не только стрелку.
-                #  Но это блять какая-то жопорвань, которая основывается и так на костыле поиска чья это блять техника
-                # e.killer_vehicle_crew.append(e.killer.id)
-
-                # killer_pos = e.killer.positions[e.frame].coordinates
-                # print('>>>>', positions[EntityType.UNIT][e.frame][(killer_pos.x, killer_pos.y)])
-                # e.killer_vehicle_crew.extend(
-                #     positions[EntityType.UNIT][e.frame][(killer_pos.x, killer_pos.y)]
-                # )
-                # print('!>>>', parse_players_in_vehicle(ocap, e.killer_vehicle.id, e.frame))
+                e.killer_vehicle = self.vehicles[killer_vehicle_id]
 
-        return ocap
+    def set_killer_vehicle_crews(self, crews: list[list[int]]) -> None:
+        for e, crew in zip(self.events, crews):
+            e.killer_vehicle_crew = crew
+
+
+def build_positions(players: dict[int, Player], vehicles: dict[int, Vehicle]) -> Any:
+    positions = defaultdict(
+        lambda: defaultdict(
+            lambda: defaultdict(list[int])
+        )
+    )
+    for i in (players | vehicles).values():
+        for frame, coords in enumerate(zip(i.positions.x.tolist(), i.positions.y.tolist())):
+            positions[i.entity_type][frame + i.start_frame][coords].append(i.id)
+    return positions
+
+
+def entity_models(entity: dict, trusted: bool = False) -> list[Player | Vehicle]:
+    """Модели сущности OCAP: юнит (есть isPlayer) и/или ТС, кроме парашютов."""
+    models = []
+    if entity.get("isPlayer", None) is not None:
+        models.append(Player.from_entity(entity, trusted))
+    if entity.get("type") == EntityType.VEHICLE and entity.get("class") != VehicleType.PARACHUTE:
+        models.append(Vehicle.from_entity(entity, trusted))
+    return models
+
+
+def parse_entity_batch(text: str, trusted: bool = False) -> tuple[int, list[Player | Vehicle]]:
+    """Кусок сущностей от OcapReader(entity_batch_chars=...): число сущностей и модели в порядке файла."""
+    try:
+        entities = json.loads(f"[{text}]")
+    except json.JSONDecodeError as e:
+        raise OcapStreamError(f"Кусок сущностей не декодируется: {e}") from None
+    models = []
+    for entity in entities:
+        models.extend(entity_models(entity, trusted))
+    return len(entities), models
+
+
+_parse_executor: tuple[int, Executor] | None = None
+
+
+def parse_executor(workers: int) -> Executor:
+    """
+    Общий пул для разбора сущностей, создается один раз на процесс. На интерпретаторе без GIL
+    (python3.13t) хватает потоков, иначе нужны процессы: валидация - чистый Python.
+    """
+    global _parse_executor
+    if _parse_executor is None or _parse_executor[0] != workers:
+        shutdown_parse_executor()
+        gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+        executor = ProcessPoolExecutor(workers) if gil_enabled else ThreadPoolExecutor(workers)
+        _parse_executor = (workers, executor)
+    return _parse_executor[1]
+
+
+def shutdown_parse_executor() -> None:
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor[1].shutdown()
+        _parse_executor = None
+
+
+def count_frames(entities: Iterable[Player | Vehicle]) -> int:
+    """Число кадров записи: кадр после последней позиции среди сущностей (start_frame + число позиций)."""
+    return max((e.start_frame + len(e.positions) for e in entities if len(e.positions)), default=0)
 
 
 def parse_players_in_vehicle(
         ocap: OCAP,
         vehicle_id: int,
         frame: int,
+        spread: int = OCAPS_CREW_SPREAD_COORDS,
 ) -> list[int]:
+    """id юнитов, стоящих на кадре frame в пределах +-spread от ТС vehicle_id."""
     veh = ocap.vehicles[vehicle_id]
-    veh_pos = veh.positions[frame]
-    spread = OCAPS_PLY_VEHICLES_SPREAD_COORDS
-    spread_list = [i - spread for i in range(spread * 2 + 1)]
-
-    crew = []
-    for i in spread_list:
-        for j in spread_list:
-            if (i, j) == (0, 0):
-                crew.extend(ocap.positions[EntityType.UNIT][frame][(veh_pos.coordinates.x, veh_pos.coordinates.y)])
-    return crew
+    index = frame - veh.start_frame
+    if not 0 <= index < len(veh.positions):
+        return []
+    return ocap.unit_index.within(frame, int(veh.positions.x[index]), int(veh.positions.y[index]), spread)
 
 
 def parse_player_vehicle_id(
         ocap: OCAP,
         player_id: int,
         frame: int,
+        spread: int = OCAPS_PLY_VEHICLES_SPREAD_COORDS,
 ) -> int | None:  # returns vehicle_id
     ply = ocap.players[player_id]
-    spread = OCAPS_PLY_VEHICLES_SPREAD_COORDS
     if frame >= len(ply.positions):
         return None
 
-    ply_pos = ply.positions[frame]
-    ply_vehicles_ids = ocap.positions[EntityType.VEHICLE][frame][(ply_pos.coordinates.x, ply_pos.coordinates.y)]
-    if ply_vehicles_ids:
-        vehicle_id, *_ = ply_vehicles_ids
-        return vehicle_id
+    ply_x, ply_y = int(ply.positions.x[frame]), int(ply.positions.y[frame])
+    index = ocap.kill_vehicle_index if frame in ocap.kill_frames else ocap.vehicle_index
+    return index.find(frame, ply_x, ply_y, spread)
 
-    spread_list = [i - spread for i in range(spread * 2 + 1)]
-    for i in spread_list:
-        for j in spread_list:
-            if (i, j) == (0, 0):
-                continue
 
-            ply_vehicle_ids = ocap.positions[EntityType.VEHICLE][frame][
-                (ply_pos.coordinates.x + i, ply_pos.coordinates.y + j)
-            ]
-            if ply_vehicle_ids:
-                vehicle_id, *_ = ply_vehicle_ids
-                return vehicle_id or None
+def resolve_killer_vehicles(
+        ocap: OCAP,
+        events: list[KillEvent],
+        spread: int = OCAPS_PLY_VEHICLES_SPREAD_COORDS,
+        sparse: bool = True,
+) -> list[int | None]:
+    """
+    То же, что parse_player_vehicle_id для каждого события, но одним пакетным запросом к индексу ТС.
+    Позиция убийцы, как и раньше, берется по номеру кадра события в его списке позиций.
+    При sparse индекс ТС строится только по кадрам убийств, иначе используется полный vehicle_index.
+    """
+    result: list[int | None] = [None] * len(events)
+    queries, frames, xs, ys = [], [], [], []
+    for n, e in enumerate(events):
+        positions = ocap.players[e.killer.id].positions
+        if e.frame >= len(positions):
+            continue
+        queries.append(n)
+        frames.append(e.frame)
+        xs.append(positions.x[e.frame])
+        ys.append(positions.y[e.frame])
+
+    # События не из ocap.events могут быть на других кадрах - для них нужен полный индекс.
+    sparse = sparse and ocap.kill_frames.issuperset(frames)
+    index = ocap.kill_vehicle_index if sparse else ocap.vehicle_index
+    for n, vehicle_id in zip(queries, index.find_many(frames, xs, ys, spread)):
+        result[n] = vehicle_id
+    return result
+
+
+def resolve_vehicle_crews(
+        ocap: OCAP,
+        events: list[KillEvent],
+        spread: int = OCAPS_CREW_SPREAD_COORDS,
+) -> list[list[int]]:
+    """
+    Экипаж ТС убийцы для каждого события: убийца и юниты, которые на кадре убийства живы, сидят в ТС
+    и находятся в пределах +-spread от позиции ТС. Для событий без ТС - пустой список.
+    Индекс юнитов строится только по кадрам убийств из ТС, все запросы выполняются одним пакетом.
+    """
+    result: list[list[int]] = [[] for _ in events]
+    queries, frames, xs, ys = [], [], [], []
+    for n, e in enumerate(events):
+        vehicle = e.killer_vehicle
+        if vehicle is None:
+            continue
+        result[n] = [e.killer.id]
+        index = e.frame - vehicle.start_frame
+        if not 0 <= index < len(vehicle.positions):
+            continue
+        queries.append(n)
+        frames.append(e.frame)
+        xs.append(vehicle.positions.x[index])
+        ys.append(vehicle.positions.y[index])
+    if not queries:
+        return result
+
+    # Живой пехотинец рядом с ТС или труп выброшенного из нее члена экипажа в экипаж не входят.
+    unit_index = FrameIndex(
+        (ocap.players or {}).values(), frames=set(frames), where=lambda track: track.alive() & track.in_vehicle(),
+    )
+    for n, crew in zip(queries, unit_index.within_many(frames, xs, ys, spread)):
+        result[n].extend(unit_id for unit_id in crew if unit_id != events[n].killer.id)
+    return result
 
 
 def get_game_type_from_file(path: Path) -> GameType | None:
@@ -0,0 +1,192 @@
+import json
+import re
+from pathlib import Path
+from typing import Any, Iterator, TextIO
+
+from module.ocap_archive import open_ocap_text
+
+ENTITIES_KEY = "entities"
+EVENTS_KEY = "events"
+# Сущности кусками сырого текста (OcapReader(entity_batch_chars=...)).
+ENTITY_BATCH_KEY = "entities_batch"
+
+CHUNK_SIZE = 1 << 20  # 1 MiB текста за одно чтение.
+
+_WHITESPACE = " \t\n\r"
+
+_OBJECT_SPLIT = re.compile(r"\}\s*,\s*\{")
+_OBJECT_END = re.compile(r"\}\s*\]")
+
+
+class OcapStreamError(ValueError):
+    pass
+
+
+class _JsonStream:
+    """
+    Минимальный потоковый разбор JSON поверх json.JSONDecoder.raw_decode.
+    В памяти держится только текущий кусок файла и один декодируемый элемент.
+    """
+
+    def __init__(self, fd: TextIO, chunk_size: int = CHUNK_SIZE):
+        self._fd = fd
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self, size: int | None = None) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fd.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        # Отбрасываем уже разобранную часть, чтобы буфер не рос до размера файла.
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read_more():
+                return ""
+
+    def take(self) -> str:
+        char = self.peek()
+        self._pos += 1
+        return char
+
+    def expect(self, char: str) -> None:
+        found = self.take()
+        if found != char:
+            raise OcapStreamError(f"Ожидался {char!r}, получен {found!r}")
+
+    def value(self) -> Any:
+        self.peek()
+        read_size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # Элемент не поместился в буфер целиком - дочитываем с ростом порции.
+                if not self._read_more(read_size):
+                    raise
+                read_size *= 2
+                continue
+            # Число в самом конце буфера могло оборваться на середине.
+            if end == len(self._buf) and not self._eof and self._read_more():
+                continue
+            self._pos = end
+            return value
+
+    def items(self) -> Iterator[Any]:
+        """Поэлементно отдает значения JSON-массива."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.take()
+            return
+        while True:
+            yield self.value()
+            char = self.take()
+            if char == "]":
+                return
+            if char != ",":
+                raise OcapStreamError(f"Ожидался ',' или ']', получен {char!r}")
+
+    def object_batches(self, batch_chars: int) -> Iterator[str]:
+        """
+        Элементы массива объектов кусками сырого текста примерно по batch_chars, без декодирования:
+        '[' + кусок + ']' - JSON-массив из целых элементов. Границы ищутся по '},{' и '}]', поэтому
+        скобка внутри строки может дать неверный разрез - такой кусок не декодируется, и это
+        должен проверить тот, кто его разбирает.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.take()
+            return
+        while True:
+            end = _OBJECT_END.search(self._buf, self._pos)
+            split = _OBJECT_SPLIT.search(self._buf, self._pos + batch_chars)
+            if split is not None and (end is None or split.start() < end.start()):
+                yield self._buf[self._pos:split.start() + 1]
+                self._pos = split.end() - 1
+            elif end is not None:
+                yield self._buf[self._pos:end.start() + 1]
+                self._pos = end.end()
+                return
+            elif not self._read_more():
+                raise OcapStreamError("Массив объектов не закрыт до конца файла")
+
+    def skip_array(self) -> None:
+        for _ in self.items():
+            pass
+
+
+class OcapReader:
+    """
+    Однопроходное чтение файла OCAP.
+    Итерация отдает пары (ENTITIES_KEY, entity) и (EVENTS_KEY, event) по мере чтения файла,
+    попутно собирая скалярные поля заголовка (missionName, worldName, ...) и победителя миссии.
+    Прочие массивы верхнего уровня (Markers, times) пропускаются без загрузки в память.
+    С entity_batch_chars сущности не декодируются, а отдаются парами (ENTITY_BATCH_KEY, текст)
+    кусками по object_batches - для разбора в других процессах.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = CHUNK_SIZE, entity_batch_chars: int | None = None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.entity_batch_chars = entity_batch_chars
+        self.header: dict[str, Any] = {}
+        self.win_side: str | None = None
+        self._end_mission_seen = False
+
+    def __iter__(self) -> Iterator[tuple[str, Any]]:
+        with open_ocap_text(self.path) as fd:
+            stream = _JsonStream(fd, self.chunk_size)
+            stream.expect("{")
+            if stream.peek() == "}":
+                return
+            while True:
+                key = stream.value()
+                stream.expect(":")
+                if key == ENTITIES_KEY and self.entity_batch_chars and stream.peek() == "[":
+                    for batch in stream.object_batches(self.entity_batch_chars):
+                        yield ENTITY_BATCH_KEY, batch
+                elif key in (ENTITIES_KEY, EVENTS_KEY) and stream.peek() == "[":
+                    for item in stream.items():
+                        if key == EVENTS_KEY:
+                            self._check_end_mission(item)
+                        yield key, item
+                elif stream.peek() == "[":
+                    stream.skip_array()
+                else:
+                    value = stream.value()
+                    if not isinstance(value, dict):
+                        self.header[key] = value
+
+                char = stream.take()
+                if char == "}":
+                    return
+                if char != ",":
+                    raise OcapStreamError(f"Ожидался ',' или '}}', получен {char!r}")
+
+    def _check_end_mission(self, event: Any) -> None:
+        if self._end_mission_seen:
+            return
+        if isinstance(event, list) and len(event) >= 2 and event[1] == "endMission":
+            self._end_mission_seen = True
+            self.win_side = event[2][0] if len(event) > 2 and isinstance(event[2], list) else None
+
+    @property
+    def mission_name(self) -> str | None:
+        return self.header.get("missionName", "Unknown Mission")
+
+    @property
+    def world_name(self) -> str | None:
+        return self.header.get("worldName", "Unknown World")
@@ -0,0 +1,150 @@
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+
+class FrameIndex:
+    """
+    Позиции сущностей, сгруппированные по абсолютному кадру (start_frame + номер позиции).
+    Для каждого кадра строки лежат подряд в порядке перебора сущностей, поэтому запрос
+    по кадру - это срез массивов, а поиск внутри окна - векторная проверка по срезу.
+    where - маска позиций сущности (по ее positions), в индекс попадают только отмеченные.
+    """
+
+    def __init__(
+            self,
+            entities: Iterable[Any],
+            frames: Iterable[int] | None = None,
+            where: Callable[[Any], np.ndarray] | None = None,
+    ):
+        wanted = np.unique(np.fromiter(frames, dtype=np.int64)) if frames is not None else None
+        ids, frame_cols, x_cols, y_cols = [], [], [], []
+        for entity in entities:
+            count = len(entity.positions)
+            if not count:
+                continue
+            if wanted is None and where is None:
+                rows = np.arange(count, dtype=np.int64)
+                x_cols.append(entity.positions.x)
+                y_cols.append(entity.positions.y)
+            else:
+                # Только нужные кадры, не копируя позиции сущности целиком.
+                rows = np.arange(count, dtype=np.int64) if wanted is None else wanted - entity.start_frame
+                rows = rows[(rows >= 0) & (rows < count)]
+                if where is not None:
+                    rows = rows[where(entity.positions)[rows]]
+                x_cols.append(entity.positions.x[rows])
+                y_cols.append(entity.positions.y[rows])
+            ids.append(np.full(len(rows), entity.id, dtype=np.int64))
+            frame_cols.append(rows + entity.start_frame)
+
+        if ids:
+            ids, frame_col = np.concatenate(ids), np.concatenate(frame_cols)
+            x_col, y_col = np.concatenate(x_cols), np.concatenate(y_cols)
+        else:
+            ids = frame_col = np.empty(0, dtype=np.int64)
+            x_col = y_col = np.empty(0, dtype=np.int32)
+
+        # Стабильная сортировка сохраняет порядок сущностей внутри кадра.
+        order = np.argsort(frame_col, kind="stable")
+        self.ids = ids[order]
+        self.frames = frame_col[order]
+        self.x = x_col[order].astype(np.int64)
+        self.y = y_col[order].astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def frame_slice(self, frame: int) -> slice:
+        start, stop = np.searchsorted(self.frames, [frame, frame + 1])
+        return slice(int(start), int(stop))
+
+    def at(self, frame: int, x: int, y: int) -> list[int]:
+        """id сущностей ровно в точке (x, y) на кадре."""
+        rows = self.frame_slice(frame)
+        hit = (self.x[rows] == x) & (self.y[rows] == y)
+        return self.ids[rows][hit].tolist()
+
+    def within(self, frame: int, x: int, y: int, spread: int) -> list[int]:
+        """id сущностей в квадрате +-spread вокруг (x, y) на кадре."""
+        rows = self.frame_slice(frame)
+        hit = (np.abs(self.x[rows] - x) <= spread) & (np.abs(self.y[rows] - y) <= spread)
+        return self.ids[rows][hit].tolist()
+
+    def within_many(
+            self,
+            frames: Iterable[int],
+            xs: Iterable[int],
+            ys: Iterable[int],
+            spread: int,
+    ) -> list[list[int]]:
+        """Пакетный within: для каждой точки id сущностей в квадрате +-spread на ее кадре, в порядке перебора."""
+        frames = np.asarray(list(frames), dtype=np.int64)
+        xs = np.asarray(list(xs), dtype=np.int64)
+        ys = np.asarray(list(ys), dtype=np.int64)
+        result: list[list[int]] = [[] for _ in range(len(frames))]
+        if not len(frames) or not len(self):
+            return result
+
+        for frame in np.unique(frames):
+            queries = np.flatnonzero(frames == frame)
+            rows = self.frame_slice(int(frame))
+            if rows.start == rows.stop:
+                continue
+            inside = (
+                (np.abs(self.x[rows][None, :] - xs[queries][:, None]) <= spread)
+                & (np.abs(self.y[rows][None, :] - ys[queries][:, None]) <= spread)
+            )
+            ids = self.ids[rows]
+            for query, hit in zip(queries.tolist(), inside):
+                result[query] = ids[hit].tolist()
+        return result
+
+    def find(self, frame: int, x: int, y: int, spread: int) -> int | None:
+        return self.find_many([frame], [x], [y], spread)[0]
+
+    def find_many(
+            self,
+            frames: Iterable[int],
+            xs: Iterable[int],
+            ys: Iterable[int],
+            spread: int,
+    ) -> list[int | None]:
+        """
+        Пакетный поиск сущности в окне +-spread для набора точек.
+        Приоритет совпадает с прежним перебором смещений по словарю координат:
+        сначала точное совпадение, затем смещения по возрастанию (dx, dy),
+        при равенстве - первая сущность в порядке перебора.
+        На точном совпадении возвращается id как есть, на смещении - `id or None`.
+        """
+        frames = np.asarray(list(frames), dtype=np.int64)
+        xs = np.asarray(list(xs), dtype=np.int64)
+        ys = np.asarray(list(ys), dtype=np.int64)
+        result: list[int | None] = [None] * len(frames)
+        if not len(frames) or not len(self):
+            return result
+
+        side = spread * 2 + 1
+        no_hit = side * side
+        for frame in np.unique(frames):
+            queries = np.flatnonzero(frames == frame)
+            rows = self.frame_slice(int(frame))
+            if rows.start == rows.stop:
+                continue
+
+            dx = self.x[rows][None, :] - xs[queries][:, None]
+            dy = self.y[rows][None, :] - ys[queries][:, None]
+            inside = (np.abs(dx) <= spread) & (np.abs(dy) <= spread)
+            exact = (dx == 0) & (dy == 0)
+            score = np.where(exact, -1, (dx + spread) * side + (dy + spread))
+            score = np.where(inside, score, no_hit)
+
+            # argmin берет первый минимум, т.е. первую сущность в порядке перебора.
+            best = score.argmin(axis=1)
+            best_score = score[np.arange(len(queries)), best]
+            ids = self.ids[rows][best]
+            for query, entity_id, entity_score in zip(queries.tolist(), ids.tolist(), best_score.tolist()):
+                if entity_score == no_hit:
+                    continue
+                result[query] = entity_id if entity_score == -1 else (entity_id or None)
+        return result
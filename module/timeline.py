@@ -0,0 +1,57 @@
+from typing import Any, Iterable
+
+import numpy as np
+
+
+def alive_by_side(players: Iterable[Any], frames: int) -> dict[str, np.ndarray]:
+    """
+    Число живых игроков каждой стороны на каждом кадре записи. Для юнита его колонка состояния
+    прибавляется к срезу [start_frame, start_frame + число позиций) - один векторный шаг на юнит.
+    Юниты под управлением ИИ не учитываются.
+    """
+    counts: dict[str, np.ndarray] = {}
+    for player in players:
+        alive = player.alive()
+        if alive is None:
+            continue
+        start = max(player.start_frame, 0)
+        skip = start - player.start_frame
+        length = min(len(player.positions) - skip, frames - start)
+        if length <= 0:
+            continue
+        side = counts.setdefault(player.side, np.zeros(frames, dtype=np.int32))
+        side[start:start + length] += alive[skip:skip + length]
+    return counts
+
+
+def per_bucket(frames: Iterable[int], step: int, buckets: int) -> np.ndarray:
+    """Число событий в каждом отрезке [k * step, (k + 1) * step). События вне записи отбрасываются."""
+    frames = np.fromiter(frames, dtype=np.int64)
+    frames = frames[(frames >= 0) & (frames < buckets * step)]
+    return np.bincount(frames // step, minlength=buckets)
+
+
+def mission_timeline(ocap: Any, step: int) -> dict:
+    """
+    Прореженная шкала миссии: точка на каждый step-й кадр.
+    alive - живые игроки сторон на кадре точки, kills (по стороне убийцы) и vehicle_losses - события
+    на отрезке от кадра точки до следующей точки.
+    """
+    frames = max(ocap.max_frame + 1, 0)
+    buckets = -(-frames // step)
+    events = ocap.events or []
+    players = ocap.players or {}
+    vehicles = ocap.vehicles or {}
+
+    kills_by_side: dict[str, list[int]] = {}
+    for e in events:
+        if e.killed.id in players:
+            kills_by_side.setdefault(e.killer.side, []).append(e.frame)
+
+    return {
+        "step": step,
+        "frames": frames,
+        "alive": {side: counts[::step].tolist() for side, counts in sorted(alive_by_side(players.values(), frames).items())},
+        "kills": {side: per_bucket(kill_frames, step, buckets).tolist() for side, kill_frames in sorted(kills_by_side.items())},
+        "vehicle_losses": per_bucket((e.frame for e in events if e.killed.id in vehicles), step, buckets).tolist(),
+    }
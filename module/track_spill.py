@@ -0,0 +1,75 @@
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+from module.metrics import rss_bytes
+
+
+class MemoryBudgetError(MemoryError):
+    pass
+
+
+class TrackSpill:
+    """
+    Временный файл под directory, в который выгружаются колонки позиций.
+    В памяти вместо массивов остаются отображения файла (memmap): страницы подгружаются с диска
+    по мере чтения и могут быть вытеснены системой. Файл удаляется сразу при создании,
+    место на диске освобождается, когда закрыты все отображения.
+    """
+
+    def __init__(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        self._fd = tempfile.TemporaryFile(dir=directory, prefix="ocap_spill_")
+        self.bytes = 0
+
+    def spill(self, columns: list[np.ndarray]) -> list[np.ndarray]:
+        """Пишет колонки одинаковой длины в файл и возвращает их отображения только для чтения."""
+        offset = self.bytes
+        length = len(columns[0])
+        for column in columns:
+            self._fd.write(np.ascontiguousarray(column, dtype=np.int32).tobytes())
+        self._fd.flush()
+        self.bytes += 4 * length * len(columns)
+        if not length:
+            return [np.empty(0, dtype=np.int32) for _ in columns]
+        block = np.memmap(self._fd, dtype=np.int32, mode="r", offset=offset, shape=(len(columns), length))
+        return list(block)
+
+
+class MemoryGuard:
+    """
+    Ограничение памяти при разборе одной миссии. После каждой сущности проверяется RSS процесса:
+    выше spill_at колонки позиций (уже разобранные и все последующие) выгружаются в TrackSpill,
+    выше budget разбор прерывается MemoryBudgetError - миссия считается необработанной,
+    а процесс не падает по OOM.
+    """
+
+    def __init__(self, budget: int, spill_dir: Path, spill_at: int | None = None):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.spill_at = budget // 2 if spill_at is None else spill_at
+        self.spill: TrackSpill | None = None
+
+    @property
+    def spilled(self) -> bool:
+        return self.spill is not None
+
+    def admit(self, entity: Any, loaded: Iterable[Any]) -> None:
+        """
+        Вызывается после разбора каждой сущности.
+        :param loaded: все уже разобранные сущности, включая entity.
+        """
+        if self.spill is not None:
+            entity.positions.spill_to(self.spill)
+        elif rss_bytes() > self.spill_at:
+            self.spill = TrackSpill(self.spill_dir)
+            for e in loaded:
+                e.positions.spill_to(self.spill)
+
+        rss = rss_bytes()
+        if rss > self.budget:
+            raise MemoryBudgetError(
+                f"Разбор превысил лимит памяти: {rss / 1024 ** 2:.0f} МБ из {self.budget / 1024 ** 2:.0f} МБ"
+            )